@@ -0,0 +1,102 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+"""
+Benchmark of the stages that build large dataframes row by row. It times them for a growing number of rows and
+fits the exponent of time ~ rows^k, which is ~1 when the stage scales linearly with the number of rows.
+
+    python -m benchmarks.bench_row_builders
+"""
+
+import argparse
+import importlib
+import time
+
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import synthetic_scenarios
+from model.constants import ACH_PER_SECTOR
+from pointers import METADATA_FILE_PATH
+
+inference = importlib.import_module("model.1_prepare_data_and_inference")
+prediction = importlib.import_module("model.2_prediction")
+
+SECTORS = list(ACH_PER_SECTOR.keys())
+
+
+def synthetic_weighted_average(scenarios_array):
+    return pd.DataFrame([{"YEAR": scenario.split("_")[-1],
+                          "BUILDING_CLASS": sector,
+                          "SCENARIO": scenario,
+                          "TOTAL_HEATING_kWh_m2_yr": 80.0,
+                          "TOTAL_COOLING_kWh_m2_yr": 40.0} for scenario in scenarios_array for sector in SECTORS])
+
+
+def time_function(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+def main(sizes, n_samples, repeat):
+    floor_area_predictions_df = pd.read_excel(METADATA_FILE_PATH, sheet_name="FLOOR_AREA").set_index('year')
+    years = [str(year) for year in floor_area_predictions_df.index]
+
+    results = {"calc_total_energy_consumption_per_scenario": [], "calc_final_result": []}
+    for n_scenarios in sizes:
+        scenarios_array = np.array(synthetic_scenarios(n_scenarios, years))
+        data_weighted_average_df = synthetic_weighted_average(scenarios_array)
+        data_final_df = inference.calc_total_energy_consumption_per_scenario(data_weighted_average_df,
+                                                                             floor_area_predictions_df,
+                                                                             scenarios_array,
+                                                                             n_samples=n_samples)
+        seconds = time_function(lambda: inference.calc_total_energy_consumption_per_scenario(
+            data_weighted_average_df, floor_area_predictions_df, scenarios_array, n_samples=n_samples), repeat)
+        results["calc_total_energy_consumption_per_scenario"].append((len(data_final_df), seconds))
+
+        data_consumption = data_final_df.groupby(["BUILDING_CLASS", "SCENARIO"]).agg(
+            ['median', 'min', 'max']).rename(columns={'median': 'percentile_50', 'min': 'percentile_2.5',
+                                                     'max': 'percentile_97.5'})
+        seconds = time_function(lambda: prediction.calc_final_result(data_consumption, scenarios_array), repeat)
+        results["calc_final_result"].append((n_scenarios * len(SECTORS) * 9, seconds))
+
+    for stage, timings in results.items():
+        rows, seconds = np.array(timings).T
+        exponent = np.polyfit(np.log(rows), np.log(seconds), 1)[0]
+        print(stage)
+        for n_rows, t in timings:
+            print("  {:>10d} rows {:>10.4f} s {:>10.3f} us/row".format(int(n_rows), t, t / n_rows * 1E6))
+        print("  time ~ rows^{:.2f}".format(exponent))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling of the dataframe builders with the number of rows")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[30, 120, 480, 1920],
+                        help="number of synthetic scenarios")
+    parser.add_argument("--samples", type=int, default=100, help="montecarlo samples per scenario and sector")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions, the fastest one is reported")
+    args = parser.parse_args()
+    main(args.sizes, args.samples, args.repeat)
@@ -0,0 +1,83 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+"""
+Check of the batched kernel of model/enthalpy.py against the enthalpygradients library on synthetic weather data.
+It exits with an error when they do not agree, e.g., after a change of the kernel.
+
+    python -m benchmarks.check_enthalpy --series 20
+"""
+
+import argparse
+import sys
+
+import numpy as np
+from enthalpygradients import EnthalpyGradient
+
+from benchmarks.synthetic import synthetic_hourly_weather
+from model.constants import COP_cooling, COP_heating, RH_base_cooling_perc, RH_base_heating_perc, T_base_cooling_C, \
+    T_base_heating_C, ACH_Residential, ACH_Commercial
+from model.enthalpy import LOAD_TYPES, calc_specific_thermal_consumption_batch
+
+
+def calc_specific_thermal_consumption_reference(T_out_C, RH_out_C, ACH):
+    """
+    Same result as calc_specific_thermal_consumption_batch for one weather series, with one call of
+    EnthalpyGradient.specific_thermal_consumption per load type and air change rate, as step 1 did before the kernel
+    """
+    eg_cooling = EnthalpyGradient(T_base_cooling_C, RH_base_cooling_perc)
+    eg_heating = EnthalpyGradient(T_base_heating_C, RH_base_heating_perc)
+    result = np.empty((len(ACH), len(LOAD_TYPES)))
+    for i, air_changes in enumerate(ACH):
+        for j, load_type in enumerate(LOAD_TYPES):
+            eg, COP = (eg_cooling, COP_cooling) if j < 2 else (eg_heating, COP_heating)
+            result[i, j] = eg.specific_thermal_consumption(T_out_C, RH_out_C, type=load_type, ACH=air_changes,
+                                                           COP=COP)
+    return result
+
+
+def check_enthalpy_kernel(n_series=20, seed=0, ACH=(ACH_Residential, ACH_Commercial)):
+    """
+    :return: largest relative difference between the kernel and the library over n_series synthetic years, from a
+        cold to a hot climate so every load type is present
+    """
+    rng = np.random.default_rng(seed)
+    weather = [synthetic_hourly_weather(rng, mean_C) for mean_C in np.linspace(-10.0, 25.0, n_series)]
+    T_out_C = np.array([T for T, RH in weather])
+    RH_out_C = np.array([RH for T, RH in weather])
+    batch = calc_specific_thermal_consumption_batch(T_out_C, RH_out_C, ACH=ACH)
+    reference = np.array([calc_specific_thermal_consumption_reference(T, RH, ACH) for T, RH in weather])
+    return np.max(np.abs(batch - reference) / np.maximum(np.abs(reference), np.finfo(np.float64).tiny))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check of the enthalpy gradients kernel against enthalpygradients")
+    parser.add_argument("--series", type=int, default=20, help="number of synthetic years of weather data")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic weather data")
+    parser.add_argument("--rtol", type=float, default=1e-10, help="largest relative difference accepted")
+    args = parser.parse_args()
+
+    relative_difference = check_enthalpy_kernel(n_series=args.series, seed=args.seed)
+    print("largest relative difference: {:.2e}".format(relative_difference))
+    if not relative_difference <= args.rtol:
+        sys.exit("the kernel does not agree with enthalpygradients (rtol {:.0e})".format(args.rtol))
@@ -0,0 +1,148 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+"""
+Benchmark of every stage of the model on synthetic inputs, written as JSON to track regressions.
+
+    python -m benchmarks.run_benchmarks --cities 47 --scenarios 30 --samples 100000 --output benchmark.json
+"""
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def time_stage(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - t0)
+    return result, {"seconds": min(timings), "timings": timings}
+
+
+def run_benchmarks(n_cities, n_scenarios, n_samples, repeat, workdir):
+    # the weather folders have to be set before the model is imported
+    os.environ["DEG_USA_WEATHER_DATA"] = os.path.join(workdir, "weather_data")
+    os.environ["DEG_USA_WEATHER_CACHE"] = os.path.join(workdir, "weather_cache")
+    from benchmarks.synthetic import write_synthetic_metadata, write_synthetic_weather
+    from model.auxiliary import get_weather_file_location, parse_weather_file, read_weather_data_scenario
+    from model.constants import ACH_PER_SECTOR
+    from model.enthalpy import calc_specific_thermal_consumption_batch
+    from model.metadata import load_metadata
+    from model.montecarlo import draw_normal_samples, get_floor_area_distribution
+    from model.percentiles import calc_percentiles_per_group
+    from model.weights import calc_city_weight_matrix, calc_national_intensity, get_region_weights
+    inference = importlib.import_module("model.1_prepare_data_and_inference")
+
+    metadata_file_path = os.path.join(workdir, "metadata.xlsx")
+    cities, scenarios = write_synthetic_metadata(metadata_file_path, n_cities, n_scenarios)
+    write_synthetic_weather(cities, scenarios)
+    pairs = [(city, scenario) for city in cities for scenario in scenarios]
+    stages = {}
+
+    # metadata: parsing of the workbook, then the snapshot once it exists
+    _, stages["metadata parsing"] = time_stage(lambda: load_metadata(metadata_file_path, use_snapshot=False), repeat)
+    load_metadata(metadata_file_path)
+    metadata, stages["metadata snapshot"] = time_stage(lambda: load_metadata(metadata_file_path), repeat)
+
+    # weather: parsing of the text files, then the binary copies once they exist
+    _, stages["weather parsing"] = time_stage(
+        lambda: [parse_weather_file(get_weather_file_location(city, scenario)) for city, scenario in pairs], repeat)
+    [read_weather_data_scenario(city, scenario) for city, scenario in pairs]
+    weather, stages["weather cache read"] = time_stage(
+        lambda: [read_weather_data_scenario(city, scenario) for city, scenario in pairs], repeat)
+
+    # daily enthalpy gradients, all load types and sectors of a pair in one call
+    _, stages["enthalpy gradients"] = time_stage(
+        lambda: [calc_specific_thermal_consumption_batch(T[np.newaxis, :], RH[np.newaxis, :]) for T, RH in weather],
+        repeat)
+
+    # specific energy per city as in step 1, from the weather cache and without the result cache
+    specific_thermal_consumption_per_city_df, stages["specific energy per city"] = time_stage(
+        lambda: inference.calc_specific_energy_per_major_city(metadata.cities_array, metadata.climate_region_array,
+                                                              metadata.floor_area_climate_df,
+                                                              metadata.scenarios_array), repeat)
+
+    data_weighted_average_df, stages["weighted average"] = time_stage(
+        lambda: inference.calc_weighted_average_per_scenario(specific_thermal_consumption_per_city_df), repeat)
+
+    # the same weighted average from arrays, as a matrix product with the precomputed weight of every city
+    sectors = list(ACH_PER_SECTOR.keys())
+    city_weight_matrix = calc_city_weight_matrix(metadata.climate_region_array,
+                                                 get_region_weights(metadata.floor_area_climate_df, sectors))
+    city_values = np.random.default_rng(0).random((len(metadata.scenarios_array), len(sectors),
+                                                   len(metadata.cities_array)))
+    _, stages["weighted average, matrix"] = time_stage(
+        lambda: calc_national_intensity(city_values, city_weight_matrix), repeat)
+
+    # montecarlo draw of the built area for every scenario and sector
+    years, _, _ = inference.get_weighted_average_arrays(data_weighted_average_df, metadata.scenarios_array,
+                                                        list(ACH_PER_SECTOR.keys()))
+    mean_m2, std_m2 = get_floor_area_distribution(metadata.floor_area_predictions_df, years[:, 0],
+                                                  list(ACH_PER_SECTOR.keys()))
+    _, stages["montecarlo draw"] = time_stage(lambda: draw_normal_samples(mean_m2, std_m2, n_samples), repeat)
+
+    # percentiles: from the table of samples (step 2) and streamed (step 1 --aggregate)
+    data_final_df = inference.calc_total_energy_consumption_per_scenario(
+        data_weighted_average_df, metadata.floor_area_predictions_df, metadata.scenarios_array, n_samples=n_samples)
+    _, stages["percentiles from table"] = time_stage(lambda: calc_percentiles_per_group(data_final_df), repeat)
+    for method in ['exact', 'tdigest']:
+        _, stages["percentiles streamed " + method] = time_stage(
+            lambda: inference.calc_percentiles_per_scenario(data_weighted_average_df,
+                                                            metadata.floor_area_predictions_df,
+                                                            metadata.scenarios_array, n_samples=n_samples,
+                                                            method=method), repeat)
+
+    return {"config": {"cities": n_cities, "scenarios": n_scenarios, "samples": n_samples, "repeat": repeat},
+            "environment": {"python": sys.version.split()[0], "platform": platform.platform(),
+                            "numpy": np.__version__, "pandas": pd.__version__},
+            "stages": stages}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the stages of the model on synthetic inputs")
+    parser.add_argument("--cities", type=int, default=47, help="number of synthetic cities")
+    parser.add_argument("--scenarios", type=int, default=30, help="number of synthetic scenarios")
+    parser.add_argument("--samples", type=int, default=100, help="montecarlo samples per scenario and sector")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of every stage, the fastest is reported")
+    parser.add_argument("--output", default="benchmark.json", help="JSON file with the timings")
+    parser.add_argument("--workdir", default=None,
+                        help="folder of the synthetic inputs, a temporary folder by default")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temporary_folder:
+        report = run_benchmarks(args.cities, args.scenarios, args.samples, args.repeat,
+                                args.workdir if args.workdir is not None else temporary_folder)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for stage, timing in report["stages"].items():
+        print("{:<30} {:>10.4f} s".format(stage, timing["seconds"]))
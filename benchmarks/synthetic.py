@@ -0,0 +1,115 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+"""
+Synthetic inputs for the benchmarks: hourly weather files in the format read by read_weather_data_scenario and a
+metadata.xlsx with as many cities and scenarios as needed. The real weather data of Meteonorm is not distributed.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from model.auxiliary import get_weather_file_location
+from model.constants import HOURS_OF_THE_YEAR
+from pointers import METADATA_FILE_PATH
+
+SCENARIO_FAMILIES = ['A1B', 'A2', 'B1']
+CLIMATE_REGIONS = ['Very cold/Cold', 'Mixed-humid', 'Mixed-dry/Hot-dry', 'Hot-humid', 'Marine']
+
+
+def synthetic_cities(n_cities):
+    return ["City{:05d}, S{}".format(i, i % 50) for i in range(n_cities)]
+
+
+def synthetic_scenarios(n_scenarios, years):
+    # data_<family>_<year>, numbered once the 3 families x years are used up
+    scenarios = []
+    for i in range(n_scenarios):
+        family = SCENARIO_FAMILIES[(i // len(years)) % len(SCENARIO_FAMILIES)]
+        year = years[i % len(years)]
+        prefix = "data" if i < len(years) * len(SCENARIO_FAMILIES) else "data{}".format(i)
+        scenarios.append("{}_{}_{}".format(prefix, family, year))
+    return scenarios
+
+
+def write_synthetic_metadata(metadata_file_path, n_cities, n_scenarios):
+    """
+    metadata.xlsx with synthetic CITIES and SCENARIOS sheets. The FLOOR_AREA and FLOOR_AREA_CLIMATE sheets are
+    copied from the metadata of the model.
+    """
+    floor_area_predictions_df = pd.read_excel(METADATA_FILE_PATH, sheet_name="FLOOR_AREA")
+    floor_area_climate_df = pd.read_excel(METADATA_FILE_PATH, sheet_name="FLOOR_AREA_CLIMATE")
+    cities = synthetic_cities(n_cities)
+    cities_df = pd.DataFrame({"CITY": cities,
+                              "WEATHER STATION": [city.replace(", ", "_") + "-hour" for city in cities],
+                              "STATE": [city.split(", ")[-1] for city in cities],
+                              "CLIMATE": "synthetic",
+                              "Climate Region": [CLIMATE_REGIONS[i % len(CLIMATE_REGIONS)] for i in range(n_cities)]})
+    scenarios_df = pd.DataFrame({"SCENARIO": synthetic_scenarios(n_scenarios,
+                                                                 [str(year) for year in
+                                                                  floor_area_predictions_df['year']])})
+    with pd.ExcelWriter(metadata_file_path) as writer:
+        cities_df.to_excel(writer, sheet_name='CITIES', index=False)
+        scenarios_df.to_excel(writer, sheet_name='SCENARIOS', index=False)
+        floor_area_predictions_df.to_excel(writer, sheet_name='FLOOR_AREA', index=False)
+        floor_area_climate_df.to_excel(writer, sheet_name='FLOOR_AREA_CLIMATE', index=False)
+    return cities, list(scenarios_df['SCENARIO'])
+
+
+def write_synthetic_weather(cities, scenarios, seed=0):
+    """
+    One hourly weather file per city and scenario in the weather folder of pointers.py, with seasonal and daily
+    cycles of temperature and relative humidity plus noise
+    """
+    rng = np.random.default_rng(seed)
+    hours = np.arange(HOURS_OF_THE_YEAR)
+    month = 1 + np.minimum(hours // 730, 11)
+    day = 1 + (hours // 24) % 30
+    hour = 1 + hours % 24
+    for city_number, city in enumerate(cities):
+        mean_C = 5.0 + 20.0 * city_number / max(len(cities) - 1, 1)
+        for scenario in scenarios:
+            Ta, RH = synthetic_hourly_weather(rng, mean_C)
+            weather_file_location = get_weather_file_location(city, scenario)
+            os.makedirs(os.path.dirname(weather_file_location), exist_ok=True)
+            with open(weather_file_location, 'w') as f:
+                f.write("{}\n".format(city))
+                f.write(" 40.00 -100.00 100 1 1\n")
+                f.write(" m dy h G_Gh G_Dh Ta Td RH FF DD\n")
+                np.savetxt(f, np.column_stack([month, day, hour, np.zeros(HOURS_OF_THE_YEAR),
+                                               np.zeros(HOURS_OF_THE_YEAR), Ta, Ta - 5.0, RH,
+                                               np.full(HOURS_OF_THE_YEAR, 3.0), np.zeros(HOURS_OF_THE_YEAR)]),
+                           fmt=[" %d", "%d", "%d", "%d", "%d", "%.1f", "%.1f", "%d", "%.1f", "%d"])
+
+
+def synthetic_hourly_weather(rng, mean_C):
+    """
+    One year of hourly temperature [C] and relative humidity [%] around a mean temperature
+    """
+    hours = np.arange(HOURS_OF_THE_YEAR)
+    Ta = (mean_C + 12.0 * np.sin(2 * np.pi * (hours / HOURS_OF_THE_YEAR - 0.3)) +
+          5.0 * np.sin(2 * np.pi * (hours - 9) / 24) + rng.normal(0.0, 2.0, HOURS_OF_THE_YEAR))
+    RH = np.clip(65.0 - 20.0 * np.sin(2 * np.pi * (hours - 9) / 24) + rng.normal(0.0, 8.0, HOURS_OF_THE_YEAR),
+                 5.0, 100.0)
+    return Ta, RH
@@ -0,0 +1,60 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import argparse
+import os
+import time
+
+from model.auxiliary import get_weather_file_location, get_weather_cache_location, is_weather_cache_valid, \
+    write_weather_cache
+from model.metadata import load_metadata
+
+
+def main(force=False):
+    # local variables
+    metadata = load_metadata()
+    scenarios_array = metadata.scenarios_array
+    cities_array = metadata.cities_array
+
+    # convert every weather file to its binary copy once, so later runs skip the parsing of text files
+    for city in cities_array:
+        for scenario in scenarios_array:
+            weather_file_location = get_weather_file_location(city, scenario)
+            if not os.path.exists(weather_file_location):
+                print("weather file {} not found, skipped".format(weather_file_location))
+                continue
+            weather_cache_location = get_weather_cache_location(city, scenario)
+            if force or not is_weather_cache_valid(weather_file_location, weather_cache_location):
+                write_weather_cache(weather_file_location, weather_cache_location)
+        print("city {} done".format(city))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Binary cache of the hourly weather files")
+    parser.add_argument("--force", action="store_true", help="rebuild every entry of the cache")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    main(force=args.force)
+    t1 = round((time.time() - t0) / 60, 2)
+    print("finished after {} minutes".format(t1))
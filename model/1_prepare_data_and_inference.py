@@ -22,142 +22,375 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
+import argparse
+import time
+import tracemalloc
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 import pandas as pd
-from enthalpygradients import EnthalpyGradient
-import time
-from model.auxiliary import read_weather_data_scenario
+from model.auxiliary import iter_submitted, read_weather_data_scenario, get_weather_file_hash, weather_read_counters
 from model.constants import COP_cooling, COP_heating, RH_base_cooling_perc, RH_base_heating_perc, T_base_cooling_C, \
-    T_base_heating_C, ACH_Commercial, ACH_Residential
-from pointers import METADATA_FILE_PATH, INTERMEDIATE_RESULT_FILE_PATH
+    T_base_heating_C, ACH_PER_SECTOR, MONTECARLO_N_SAMPLES, MONTECARLO_SEED, PAIRS_PER_TASK
+from model.enthalpy import calc_specific_thermal_consumption_batch, calc_total_heating_cooling
+from model.instrumentation import Instrumentation, profiled
+from model.journal import Journal
+from model.metadata import load_metadata
+from model.montecarlo import draw_normal_samples, get_floor_area_distribution, iter_normal_samples
+from model.percentiles import PercentileAccumulator, VALUE_COLUMNS, build_percentiles_df
+from model.result_cache import ResultCache, calc_result_cache_key
+from model.result_io import write_results, with_result_format
+from model.uncertainty import UNCERTAINTY_SOURCES, calc_joint_percentiles_per_scenario
+from model.weights import calc_city_weight_matrix, calc_national_intensity
+from pointers import INTERMEDIATE_RESULT_FILE_PATH, INTERMEDIATE_PERCENTILES_FILE_PATH
 
-
-def main():
+def main(workers=1, use_cache=True, n_samples=MONTECARLO_N_SAMPLES, seed=MONTECARLO_SEED, aggregate=None,
+         result_format='csv', instrumentation=None, joint_uncertainty=None, resume=False):
 
     # local variables
-    output_path = INTERMEDIATE_RESULT_FILE_PATH
-    scenarios_array = pd.read_excel(METADATA_FILE_PATH, sheet_name='SCENARIOS')['SCENARIO'].values
-    cities_array = pd.read_excel(METADATA_FILE_PATH, sheet_name='CITIES')['CITY'].values
-    floor_area_predictions_df = pd.read_excel(METADATA_FILE_PATH, sheet_name="FLOOR_AREA").set_index('year')
-    climate_region_array = pd.read_excel(METADATA_FILE_PATH, sheet_name='CITIES')['Climate Region'].values
-    floor_area_climate_df = pd.read_excel(METADATA_FILE_PATH, sheet_name="FLOOR_AREA_CLIMATE").set_index('Climate Region')
-
+    instrumentation = Instrumentation() if instrumentation is None else instrumentation
+    if joint_uncertainty is not None and aggregate is None:
+        # millions of joint samples do not fit in memory, only their percentiles are estimated and saved
+        aggregate = 'tdigest'
+    output_path = INTERMEDIATE_RESULT_FILE_PATH if aggregate is None else INTERMEDIATE_PERCENTILES_FILE_PATH
+    output_path = with_result_format(output_path, result_format)
+    with instrumentation.stage("metadata"):
+        metadata = load_metadata()
+    scenarios_array = metadata.scenarios_array
+    cities_array = metadata.cities_array
+    floor_area_predictions_df = metadata.floor_area_predictions_df
+    climate_region_array = metadata.climate_region_array
+    floor_area_climate_df = metadata.floor_area_climate_df
 
-    # calculate specific energy consumption per major city
-    specific_thermal_consumption_per_city_df = calc_specific_energy_per_major_city(cities_array,
-                                                                                   climate_region_array,
-                                                                                   floor_area_climate_df,
-                                                                                   scenarios_array)
+    # calculate specific energy consumption per major city, reusing the results of earlier runs. Every pair is
+    # appended to the journal, so an interrupted run can resume from the pairs it completed
+    with instrumentation.stage("specific energy per city") as stage_metrics:
+        result_cache = ResultCache() if use_cache else None
+        journal = Journal(constants={sector: get_sector_constants(sector) for sector in ACH_PER_SECTOR},
+                          resume=resume)
+        try:
+            specific_thermal_consumption_per_city_df = calc_specific_energy_per_major_city(
+                cities_array, climate_region_array, floor_area_climate_df, scenarios_array, workers=workers,
+                result_cache=result_cache, instrumentation=instrumentation, journal=journal)
+        finally:
+            journal.close()
+            if result_cache is not None:
+                result_cache.close()
+        stage_metrics["rows"] = len(specific_thermal_consumption_per_city_df)
 
     # calculate weighted average per scenario
-    data_weighted_average_df = calc_weighted_average_per_scenario(specific_thermal_consumption_per_city_df)
-
+    with instrumentation.stage("weighted average") as stage_metrics:
+        data_weighted_average_df = calc_weighted_average_per_scenario(specific_thermal_consumption_per_city_df)
+        stage_metrics["rows"] = len(data_weighted_average_df)
 
     # calculate the energy consumption per scenario incorporating variance in built areas
-    data_final_df = calc_total_energy_consumption_per_scenario(data_weighted_average_df, floor_area_predictions_df,
-                                                               scenarios_array)
+    with instrumentation.stage("montecarlo") as stage_metrics:
+        if joint_uncertainty is not None:
+            # built area, weights of the climate regions and spread between cities sampled together
+            data_final_df = calc_joint_percentiles_per_scenario(specific_thermal_consumption_per_city_df,
+                                                                cities_array, climate_region_array,
+                                                                floor_area_predictions_df, floor_area_climate_df,
+                                                                scenarios_array, list(ACH_PER_SECTOR.keys()),
+                                                                n_samples=n_samples, seed=seed, method=aggregate,
+                                                                sources=joint_uncertainty, workers=workers)
+        elif aggregate is None:
+            data_final_df = calc_total_energy_consumption_per_scenario(data_weighted_average_df,
+                                                                       floor_area_predictions_df, scenarios_array,
+                                                                       n_samples=n_samples, seed=seed)
+        else:
+            # only the percentiles of the samples are saved
+            data_final_df = calc_percentiles_per_scenario(data_weighted_average_df, floor_area_predictions_df,
+                                                          scenarios_array, n_samples=n_samples, seed=seed,
+                                                          method=aggregate)
+        stage_metrics["rows"] = len(data_final_df)
+
+    with instrumentation.stage("write results") as stage_metrics:
+        write_results(data_final_df, output_path, index=aggregate is not None)
+        stage_metrics["rows"] = len(data_final_df)
 
-    #save the results to disk
-    data_final_df.to_csv(output_path, index=False)
+    # the pairs of the journal are now in the intermediate result
+    journal.remove()
     print("done")
 
 
-def calc_total_energy_consumption_per_scenario(data_weighted_average_df, floor_area_predictions_df, scenarios_array):
-    data_final_df = pd.DataFrame()
-    for scenario in scenarios_array:
-        data_scenario = data_weighted_average_df[data_weighted_average_df["SCENARIO"] == scenario]
-        year = data_scenario['YEAR'].values[0]
-        data_floor_area_scenario = floor_area_predictions_df.loc[float(year)]
-        for sector in ['Residential', 'Commercial']:
-            # calculate totals
-            total_heating_kWhm2yr = \
-            data_scenario[data_scenario["BUILDING_CLASS"] == sector]['TOTAL_HEATING_kWh_m2_yr'].values[0]
-            total_cooling_kWhm2yr = \
-            data_scenario[data_scenario["BUILDING_CLASS"] == sector]['TOTAL_COOLING_kWh_m2_yr'].values[0]
+def calc_total_energy_consumption_per_scenario(data_weighted_average_df, floor_area_predictions_df, scenarios_array,
+                                               n_samples=MONTECARLO_N_SAMPLES, seed=MONTECARLO_SEED):
+    sectors = list(ACH_PER_SECTOR.keys())
+    n_scenarios, n_sectors = len(scenarios_array), len(sectors)
+    years, total_heating_kWhm2yr, total_cooling_kWhm2yr = get_weighted_average_arrays(data_weighted_average_df,
+                                                                                     scenarios_array, sectors)
 
-            # add uncertainty in total built area
-            mean_m2 = data_floor_area_scenario['GFA_mean_' + sector + '_m2']
-            std_m2 = data_floor_area_scenario['GFA_sd_' + sector + '_m2']
-            GFA_m2 = np.random.normal(mean_m2, std_m2, 100)
+    # add uncertainty in total built area, every scenario and sector in one draw
+    mean_m2, std_m2 = get_floor_area_distribution(floor_area_predictions_df, years[:, 0], sectors)
+    GFA_m2 = draw_normal_samples(mean_m2, std_m2, n_samples, seed)
 
-            total_heating_EJ = GFA_m2 * total_heating_kWhm2yr * 3.6E-12
-            total_cooling_EJ = GFA_m2 * total_cooling_kWhm2yr * 3.6E-12
+    # calculate totals
+    total_heating_EJ = GFA_m2 * total_heating_kWhm2yr[..., np.newaxis] * 3.6E-12
+    total_cooling_EJ = GFA_m2 * total_cooling_kWhm2yr[..., np.newaxis] * 3.6E-12
 
-            # list of fields to extract
-            dict_data = pd.DataFrame({"SCENARIO": scenario,
-                                      "YEAR": year,
-                                      "BUILDING_CLASS": sector,
-                                      "GFA_Bm2": GFA_m2 /1E9,
-                                      "TOTAL_HEATING_kWh_m2_yr": total_heating_kWhm2yr,
-                                      "TOTAL_COOLING_kWh_m2_yr": total_cooling_kWhm2yr,
-                                      "TOTAL_HEATING_EJ": total_heating_EJ,
-                                      "TOTAL_COOLING_EJ": total_cooling_EJ})
-            data_final_df = pd.concat([data_final_df, dict_data], ignore_index=True)
+    # list of fields to extract, one row per scenario, sector and sample
+    data_final_df = pd.DataFrame({"SCENARIO": np.repeat(scenarios_array, n_sectors * n_samples),
+                                  "YEAR": np.repeat(years.ravel(), n_samples),
+                                  "BUILDING_CLASS": np.tile(np.repeat(sectors, n_samples), n_scenarios),
+                                  "GFA_Bm2": GFA_m2.ravel() / 1E9,
+                                  "TOTAL_HEATING_kWh_m2_yr": np.repeat(total_heating_kWhm2yr.ravel(), n_samples),
+                                  "TOTAL_COOLING_kWh_m2_yr": np.repeat(total_cooling_kWhm2yr.ravel(), n_samples),
+                                  "TOTAL_HEATING_EJ": total_heating_EJ.ravel(),
+                                  "TOTAL_COOLING_EJ": total_cooling_EJ.ravel()})
     return data_final_df
 
 
+def calc_percentiles_per_scenario(data_weighted_average_df, floor_area_predictions_df, scenarios_array,
+                                  n_samples=MONTECARLO_N_SAMPLES, seed=MONTECARLO_SEED, method='exact'):
+    # same samples as calc_total_energy_consumption_per_scenario, but only their percentiles are kept
+    sectors = list(ACH_PER_SECTOR.keys())
+    years, total_heating_kWhm2yr, total_cooling_kWhm2yr = get_weighted_average_arrays(data_weighted_average_df,
+                                                                                     scenarios_array, sectors)
+    mean_m2, std_m2 = get_floor_area_distribution(floor_area_predictions_df, years[:, 0], sectors)
+
+    # fold the samples into the percentiles chunk by chunk
+    accumulators = {use: PercentileAccumulator(years.shape, method) for use in VALUE_COLUMNS}
+    for GFA_m2 in iter_normal_samples(mean_m2, std_m2, n_samples, seed):
+        accumulators["GFA_Bm2"].update(GFA_m2 / 1E9)
+        accumulators["TOTAL_HEATING_EJ"].update(GFA_m2 * total_heating_kWhm2yr[..., np.newaxis] * 3.6E-12)
+        accumulators["TOTAL_COOLING_EJ"].update(GFA_m2 * total_cooling_kWhm2yr[..., np.newaxis] * 3.6E-12)
+
+    data_percentiles_df = build_percentiles_df({use: accumulator.percentile()
+                                                for use, accumulator in accumulators.items()},
+                                               scenarios_array, sectors)
+    return data_percentiles_df
+
+
+def get_weighted_average_arrays(data_weighted_average_df, scenarios_array, sectors):
+    # year and energy intensities per scenario and sector, as arrays of shape (n_scenarios, n_sectors)
+    n_scenarios, n_sectors = len(scenarios_array), len(sectors)
+    data_weighted_average_df = data_weighted_average_df.set_index(["SCENARIO", "BUILDING_CLASS"]).loc[
+        pd.MultiIndex.from_product([scenarios_array, sectors])]
+    years = data_weighted_average_df['YEAR'].values.reshape(n_scenarios, n_sectors)
+    total_heating_kWhm2yr = data_weighted_average_df['TOTAL_HEATING_kWh_m2_yr'].values.reshape(n_scenarios, n_sectors)
+    total_cooling_kWhm2yr = data_weighted_average_df['TOTAL_COOLING_kWh_m2_yr'].values.reshape(n_scenarios, n_sectors)
+    return years, total_heating_kWhm2yr, total_cooling_kWhm2yr
+
+
 def calc_weighted_average_per_scenario(specific_thermal_consumption_per_city_df):
-    data_mean_per_scenario = specific_thermal_consumption_per_city_df.groupby(
-        ["YEAR", "BUILDING_CLASS", "SCENARIO", "CLIMATE"],
-        as_index=False).agg('mean')
-    data_mean_per_scenario["TOTAL_HEATING_kWh_m2_yr"] = data_mean_per_scenario["TOTAL_HEATING_kWh_m2_yr"] * \
-                                                        data_mean_per_scenario["WEIGHT"]
-    data_mean_per_scenario["TOTAL_COOLING_kWh_m2_yr"] = data_mean_per_scenario["TOTAL_COOLING_kWh_m2_yr"] * \
-                                                        data_mean_per_scenario["WEIGHT"]
-    data_weighted_average = data_mean_per_scenario.groupby(["YEAR", "BUILDING_CLASS", "SCENARIO"], as_index=False).agg(
-        'sum')
-    return data_weighted_average
-
-
-def calc_specific_energy_per_major_city(cities_array, climate_region_array, floor_area_climate_df, scenarios_array):
-    specific_thermal_consumption_per_city_df = pd.DataFrame()
-    for city, climate in zip(cities_array, climate_region_array):
-        floor_area_climate = floor_area_climate_df.loc[climate]
-        for scenario in scenarios_array:
-            # read wheater data
-            T_outdoor_C, RH_outdoor_perc = read_weather_data_scenario(city, scenario)
-
-            # get the scanario year
+    """
+    Mean of the cities of every climate region, weighted by the WEIGHT of the region and summed over the regions,
+    per scenario and building class. Every city needs a value for every scenario and building class.
+    """
+    keys = ["YEAR", "SCENARIO"]
+    value_columns = ["TOTAL_HEATING_kWh_m2_yr", "TOTAL_COOLING_kWh_m2_yr"]
+
+    # weight of every city, from the weight of its climate region and the number of cities of the region
+    cities_df = specific_thermal_consumption_per_city_df.drop_duplicates("CITY")
+    sectors = sorted(specific_thermal_consumption_per_city_df["BUILDING_CLASS"].unique())
+    region_weights = specific_thermal_consumption_per_city_df.groupby(["CLIMATE", "BUILDING_CLASS"])["WEIGHT"].first()
+    city_weight_matrix = calc_city_weight_matrix(cities_df["CLIMATE"].values,
+                                                 region_weights.unstack()[sectors])
+
+    # dense array of shape (n_groups, n_sectors, n_cities, 2)
+    groups = specific_thermal_consumption_per_city_df[keys].drop_duplicates()
+    group_index = specific_thermal_consumption_per_city_df.groupby(keys, sort=False).ngroup().values
+    sector_index = pd.Categorical(specific_thermal_consumption_per_city_df["BUILDING_CLASS"], categories=sectors).codes
+    city_index = pd.Categorical(specific_thermal_consumption_per_city_df["CITY"], categories=cities_df["CITY"]).codes
+    city_values = np.full((len(groups), len(sectors), len(cities_df), 2), np.nan)
+    city_values[group_index, sector_index, city_index] = specific_thermal_consumption_per_city_df[value_columns].values
+    if np.isnan(city_values).any():
+        raise ValueError("every city needs a value for every scenario and building class")
+
+    # national intensities as one matrix product per sector
+    data_weighted_average = groups.iloc[np.repeat(np.arange(len(groups)), len(sectors))].reset_index(drop=True)
+    data_weighted_average["BUILDING_CLASS"] = np.tile(sectors, len(groups))
+    data_weighted_average["WEIGHT"] = np.tile(city_weight_matrix.sum(axis=1), len(groups))
+    for i, column in enumerate(value_columns):
+        data_weighted_average[column] = calc_national_intensity(city_values[..., i], city_weight_matrix).ravel()
+    data_weighted_average = data_weighted_average[["YEAR", "BUILDING_CLASS", "SCENARIO", "WEIGHT"] + value_columns]
+    return data_weighted_average.sort_values(["YEAR", "BUILDING_CLASS", "SCENARIO"]).reset_index(drop=True)
+
+
+def calc_specific_energy_per_major_city(cities_array, climate_region_array, floor_area_climate_df, scenarios_array,
+                                        workers=1, result_cache=None, instrumentation=None, journal=None):
+    instrumentation = Instrumentation() if instrumentation is None else instrumentation
+    sectors = list(ACH_PER_SECTOR.keys())
+    pairs = [(city, climate, scenario) for city, climate in zip(cities_array, climate_region_array)
+             for scenario in scenarios_array]
+
+    # the journal and the result cache only reuse a pair calculated with the same weather data. The weather files are
+    # hashed in this process, which counts as reading weather data
+    if journal is not None or result_cache is not None:
+        with instrumentation.reading("weather file hashes"):
+            weather_file_hashes = [get_weather_file_hash(city, scenario) for city, climate, scenario in pairs]
+
+    # pairs completed by an interrupted run
+    journaled = {}
+    if journal is not None:
+        journaled = {i: journal.get(city, scenario, weather_file_hashes[i])
+                     for i, (city, climate, scenario) in enumerate(pairs)}
+        journaled = {i: values for i, values in journaled.items() if values is not None}
+
+    # look up the pairs already calculated with the same weather data and constants
+    cached = dict(journaled)
+    if result_cache is not None:
+        keys = [[calc_result_cache_key(weather_file_hash, get_sector_constants(sector)) for sector in sectors]
+                for weather_file_hash in weather_file_hashes]
+        found = result_cache.get([key for pair_keys in keys for key in pair_keys])
+        cached.update({i: [found[key] for key in pair_keys] for i, pair_keys in enumerate(keys)
+                       if i not in journaled and all(key in found for key in pair_keys)})
+    missing = [i for i in range(len(pairs)) if i not in cached]
+
+    # every (city, scenario) pair is independent, so they can be fanned out to a pool of processes in small chunks.
+    # The results come in the order of the pairs, so the rows come out exactly as in a serial run. Only a few chunks
+    # are submitted ahead, so every result reaches the journal and the result cache as soon as possible and an error
+    # does not wait for the rest of the pairs.
+    missing_pairs = [(pairs[i][0], pairs[i][2]) for i in missing]
+    if workers > 1 and len(missing) > 1:
+        # the peak memory is only measured in this process, a forked worker does not trace its allocations
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=tracemalloc.stop)
+        chunk_size = max(1, min(PAIRS_PER_TASK, len(missing) // (workers * 4)))
+        chunks = ((missing_pairs[start:start + chunk_size],) for start in range(0, len(missing), chunk_size))
+        computed = (result for _, chunk_results in iter_submitted(executor, calc_specific_energy_pairs_timed, chunks,
+                                                                  max_pending=4 * workers)
+                    for result in chunk_results)
+    else:
+        executor = None
+        computed = (calc_specific_energy_city_scenario_timed(city, scenario) for city, scenario in missing_pairs)
+
+    dict_data = []
+    try:
+        for i, (city, climate, scenario) in enumerate(pairs):
+            if i in cached:
+                specific_thermal_consumption_kWhm2yr = cached[i]
+                if journal is not None and i not in journaled:
+                    journal.append(city, scenario, weather_file_hashes[i], specific_thermal_consumption_kWhm2yr)
+                instrumentation.pair(city, scenario, cached=True)
+            else:
+                specific_thermal_consumption_kWhm2yr, pair_metrics = next(computed)
+                if result_cache is not None:
+                    result_cache.put(dict(zip(keys[i], specific_thermal_consumption_kWhm2yr)))
+                if journal is not None:
+                    journal.append(city, scenario, weather_file_hashes[i], specific_thermal_consumption_kWhm2yr)
+                instrumentation.pair(city, scenario, cached=False, **pair_metrics)
+
+            # get the scanario year and the weight of the climate region
             year_scenario = scenario.split("_")[-1]
-            for sector, ACH in zip(['Residential', 'Commercial'], [ACH_Residential, ACH_Commercial]):
-                # calculate energy use intensities
-
-                # calculate specific energy consumption with daily enthalpy gradients model
-                eg = EnthalpyGradient(T_base_cooling_C, RH_base_cooling_perc)
-                sensible_cooling_kWhm2yr = eg.specific_thermal_consumption(T_outdoor_C, RH_outdoor_perc, type='cooling',
-                                                                           ACH=ACH, COP=COP_cooling)
-                latent_cooling_kWhm2yr = eg.specific_thermal_consumption(T_outdoor_C, RH_outdoor_perc,
-                                                                         type='dehumidification', ACH=ACH,
-                                                                         COP=COP_cooling)
-
-                eg = EnthalpyGradient(T_base_heating_C, RH_base_heating_perc)
-                sensible_heating_kWhm2yr = eg.specific_thermal_consumption(T_outdoor_C, RH_outdoor_perc, type='heating',
-                                                                           ACH=ACH, COP=COP_heating)
-                latent_heating_kWhm2yr = eg.specific_thermal_consumption(T_outdoor_C, RH_outdoor_perc,
-                                                                         type='humidification', ACH=ACH,
-                                                                         COP=COP_heating)
-
-                # calculate specific totals
-                total_heating_kWhm2yr = sensible_heating_kWhm2yr + latent_heating_kWhm2yr
-                total_cooling_kWhm2yr = sensible_cooling_kWhm2yr + latent_cooling_kWhm2yr
-
-                # list of fields to extract
-                dict_data = pd.DataFrame({"CITY": city,
-                                          "CLIMATE": climate,
-                                          "WEIGHT": floor_area_climate['GFA_mean_' + sector + '_perc'],
-                                          "SCENARIO": scenario,
-                                          "YEAR": year_scenario,
-                                          "BUILDING_CLASS": sector,
-                                          "TOTAL_HEATING_kWh_m2_yr": total_heating_kWhm2yr,
-                                          "TOTAL_COOLING_kWh_m2_yr": total_cooling_kWhm2yr}, index=[0])
-                specific_thermal_consumption_per_city_df = pd.concat(
-                    [specific_thermal_consumption_per_city_df, dict_data], ignore_index=True)
-        print("city {} done".format(city))
+            floor_area_climate = floor_area_climate_df.loc[climate]
+
+            # list of fields to extract
+            for sector, (total_heating_kWhm2yr, total_cooling_kWhm2yr) in zip(sectors,
+                                                                             specific_thermal_consumption_kWhm2yr):
+                dict_data.append({"CITY": city,
+                                  "CLIMATE": climate,
+                                  "WEIGHT": floor_area_climate['GFA_mean_' + sector + '_perc'],
+                                  "SCENARIO": scenario,
+                                  "YEAR": year_scenario,
+                                  "BUILDING_CLASS": sector,
+                                  "TOTAL_HEATING_kWh_m2_yr": total_heating_kWhm2yr,
+                                  "TOTAL_COOLING_kWh_m2_yr": total_cooling_kWhm2yr})
+            if scenario == scenarios_array[-1]:
+                print("city {} done".format(city))
+    finally:
+        # on an error, the pairs not started yet are cancelled instead of computed by the shutdown
+        computed.close()
+        if executor is not None:
+            executor.shutdown()
+    specific_thermal_consumption_per_city_df = pd.DataFrame(dict_data, columns=["CITY", "CLIMATE", "WEIGHT", "SCENARIO",
+                                                                               "YEAR", "BUILDING_CLASS",
+                                                                               "TOTAL_HEATING_kWh_m2_yr",
+                                                                               "TOTAL_COOLING_kWh_m2_yr"])
     return specific_thermal_consumption_per_city_df
 
 
+def calc_specific_energy_pairs_timed(pairs):
+    # one task of the process pool
+    return [calc_specific_energy_city_scenario_timed(city, scenario) for city, scenario in pairs]
+
+
+def calc_specific_energy_city_scenario_timed(city, scenario):
+    """
+    Specific energy consumption of a (city, scenario) pair, plus the time spent reading the weather data and in the
+    enthalpy gradients kernel, and the bytes of weather data read. It runs in the worker processes, so the counters are
+    measured here and sent back with the result.
+    """
+    counters_before = dict(weather_read_counters)
+    t0 = time.perf_counter()
+
+    # read wheater data, the copy loads the pages of the cache now instead of inside the kernel
+    T_outdoor_C, RH_outdoor_perc = read_weather_data_scenario(city, scenario)
+    T_outdoor_C, RH_outdoor_perc = np.array(T_outdoor_C), np.array(RH_outdoor_perc)
+    t1 = time.perf_counter()
+
+    specific_thermal_consumption_kWhm2yr = calc_specific_energy_weather(T_outdoor_C, RH_outdoor_perc)
+    t2 = time.perf_counter()
+    pair_metrics = {"seconds": t2 - t0,
+                    "read_seconds": t1 - t0,
+                    "kernel_seconds": t2 - t1,
+                    "weather_bytes": weather_read_counters["bytes"] - counters_before["bytes"],
+                    "parsed_bytes": weather_read_counters["parsed_bytes"] - counters_before["parsed_bytes"],
+                    "hashed_bytes": weather_read_counters["hashed_bytes"] - counters_before["hashed_bytes"]}
+    return specific_thermal_consumption_kWhm2yr, pair_metrics
+
+
+def calc_specific_energy_weather(T_outdoor_C, RH_outdoor_perc):
+    # calculate specific energy consumption with daily enthalpy gradients model, all load types and sectors at once
+    specific_thermal_consumption_kWhm2yr = calc_specific_thermal_consumption_batch(T_outdoor_C[np.newaxis, :],
+                                                                                  RH_outdoor_perc[np.newaxis, :],
+                                                                                  ACH=list(ACH_PER_SECTOR.values()))[0]
+
+    # calculate specific totals, one row per sector
+    return calc_total_heating_cooling(specific_thermal_consumption_kWhm2yr)
+
+
+def get_sector_constants(sector):
+    return {"COP_cooling": COP_cooling,
+            "COP_heating": COP_heating,
+            "T_base_cooling_C": T_base_cooling_C,
+            "RH_base_cooling_perc": RH_base_cooling_perc,
+            "T_base_heating_C": T_base_heating_C,
+            "RH_base_heating_perc": RH_base_heating_perc,
+            "ACH": ACH_PER_SECTOR[sector]}
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Specific energy consumption per city and scenario")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes used to compute the (city, scenario) pairs (default: 1, serial)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recalculate every (city, scenario) pair instead of reusing the results of earlier runs")
+    parser.add_argument("--samples", type=int, default=MONTECARLO_N_SAMPLES,
+                        help="montecarlo samples of the built area per scenario and sector")
+    parser.add_argument("--seed", type=int, default=MONTECARLO_SEED,
+                        help="seed of the montecarlo simulation, the same seed gives the same samples")
+    parser.add_argument("--aggregate", choices=['exact', 'tdigest'], default=None,
+                        help="save only the percentiles of the montecarlo samples, exact or estimated with a "
+                             "t-digest sketch in a bounded memory, instead of every sample")
+    parser.add_argument("--format", choices=['csv', 'parquet'], default='csv',
+                        help="format of the intermediate result, parquet needs pyarrow (default: csv)")
+    parser.add_argument("--joint-uncertainty", nargs='*', choices=UNCERTAINTY_SOURCES, metavar="SOURCE",
+                        help="sample the built area, the weights of the climate regions and the spread between the "
+                             "cities together (or only the sources listed, from {}), and save the percentiles "
+                             "(--aggregate tdigest by default)".format(", ".join(UNCERTAINTY_SOURCES)))
+    parser.add_argument("--trace", metavar="PATH",
+                        help="write the time of every stage and (city, scenario) pair to a JSON trace, which "
+                             "chrome://tracing and https://ui.perfetto.dev display")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also measure the peak memory of every stage with tracemalloc, which slows the run down")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="run under cProfile, print the slowest functions and save the statistics to PATH")
+    parser.add_argument("--resume", action="store_true",
+                        help="keep the (city, scenario) pairs completed by an interrupted run, read from its journal "
+                             "in the results folder, instead of starting again")
+    args = parser.parse_args()
+    if args.joint_uncertainty == []:
+        args.joint_uncertainty = UNCERTAINTY_SOURCES
+
     t0 = time.time()
-    main()
+    instrumentation = Instrumentation(measure_memory=args.trace_memory)
+    with profiled(args.profile) if args.profile else nullcontext():
+        main(workers=args.workers, use_cache=not args.no_cache, n_samples=args.samples, seed=args.seed,
+             aggregate=args.aggregate, result_format=args.format, instrumentation=instrumentation,
+             joint_uncertainty=args.joint_uncertainty, resume=args.resume)
+    instrumentation.print_summary()
+    if args.trace:
+        instrumentation.write_trace(args.trace)
     t1 = round((time.time() - t0)/60,2)
     print("finished after {} minutes".format(t1))
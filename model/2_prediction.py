@@ -22,100 +22,74 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
+import argparse
 import time
 
 import pandas as pd
-from model.constants import MODEL_NAME
-from model.auxiliary import parse_scenario_name, percentile
-from pointers import METADATA_FILE_PATH, INTERMEDIATE_RESULT_FILE_PATH, FINAL_RESULT_FILE_PATH
+from model.constants import MODEL_NAME, ACH_PER_SECTOR
+from model.auxiliary import parse_scenario_name
+from model.metadata import load_metadata
+from model.percentiles import calc_percentiles_per_group, read_percentiles
+from model.result_io import read_results, write_results, with_result_format
+from pointers import INTERMEDIATE_RESULT_FILE_PATH, INTERMEDIATE_PERCENTILES_FILE_PATH, \
+    FINAL_RESULT_FILE_PATH
 
 
-def main():
+def main(from_percentiles=False, result_format='csv'):
     # local variables
-    intermediate_result = INTERMEDIATE_RESULT_FILE_PATH
-    output_path = FINAL_RESULT_FILE_PATH
-    scenarios_array = pd.read_excel(METADATA_FILE_PATH, sheet_name='SCENARIOS')['SCENARIO'].values
+    output_path = with_result_format(FINAL_RESULT_FILE_PATH, result_format)
+    scenarios_array = load_metadata().scenarios_array
 
-    # group per scenario and building class and calculate mean and variance
-    data_consumption = pd.read_csv(intermediate_result)
-    data_consumption = data_consumption.groupby(["BUILDING_CLASS", "SCENARIO"],
-                                                as_index=False).agg([percentile(50), percentile(2.5), percentile(97.5)])
+    # percentiles of the montecarlo samples per scenario and building class
+    if from_percentiles:
+        data_consumption = read_percentiles(with_result_format(INTERMEDIATE_PERCENTILES_FILE_PATH, result_format))
+    else:
+        data_consumption = read_results(with_result_format(INTERMEDIATE_RESULT_FILE_PATH, result_format))
+        data_consumption = calc_percentiles_per_group(data_consumption)
 
-    final_df = pd.DataFrame()
+    result = calc_final_result(data_consumption, scenarios_array)
+    write_results(result, output_path, index=True)
+
+
+def calc_final_result(data_consumption, scenarios_array):
+    # the rows are collected as records, the dataframe is only built once at the end
+    records = []
     for scenario in scenarios_array:
         ipcc_scenario_name = parse_scenario_name(scenario)
         year_scenario = scenario.split("_")[-1]
-        for sector in ['Residential', 'Commercial']:
-            use = "GFA_Bm2"
-            mean_area= data_consumption.loc[sector, scenario][use, 'percentile_50']
-            est_97_5 = data_consumption.loc[sector, scenario][use, 'percentile_97.5']
-            est_2_5 = data_consumption.loc[sector, scenario][use, 'percentile_2.5']
-
-            dict_mean = {'Model': MODEL_NAME,
-                         'Region': 'USA',
-                         'Unit': 'bn m2/yr',
-                         'Variable': 'Energy Service|Buildings|' + sector +'|Floor Space',
-                         'Scenario': ipcc_scenario_name + ' - 50th percentile',
-                         'Year': year_scenario,
-                         'Value': mean_area,
-                         }
-            dict_min = {'Model': MODEL_NAME,
-                        'Region': 'USA',
-                        'Unit': 'bn m2/yr',
-                        'Variable': 'Energy Service|Buildings|' + sector +'|Floor Space',
-                        'Scenario': ipcc_scenario_name + ' - 2.5th percentile',
-                        'Year': year_scenario,
-                        'Value': est_2_5,
-                        }
-            dict_max = {'Model': MODEL_NAME,
-                        'Region': 'USA',
-                        'Unit': 'bn m2/yr',
-                        'Variable': 'Energy Service|Buildings|' + sector +'|Floor Space',
-                        'Scenario': ipcc_scenario_name + ' - 97.5th percentile',
-                        'Year': year_scenario,
-                        'Value': est_97_5,
-                        }
-            dataframe = pd.DataFrame([dict_mean, dict_min, dict_max])
-            final_df = pd.concat([final_df, dataframe], ignore_index=True)
-            for name, use in zip(['Heating|Space', 'Cooling'],
-                                 ['TOTAL_HEATING_EJ', 'TOTAL_COOLING_EJ']):
-                mean_EJ = data_consumption.loc[sector, scenario][use, 'percentile_50']
-                est_97_5_EJ = data_consumption.loc[sector, scenario][use, 'percentile_97.5']
-                est_2_5_EJ = data_consumption.loc[sector, scenario][use, 'percentile_2.5']
-
-                dict_mean = {'Model': MODEL_NAME,
-                             'Region': 'USA',
-                             'Unit': 'EJ/yr',
-                             'Variable': 'Final Energy|Buildings|' + sector + '|' + name,
-                             'Scenario': ipcc_scenario_name + ' - 50th percentile',
-                             'Year': year_scenario,
-                             'Value': mean_EJ,
-                             }
-                dict_min = {'Model': MODEL_NAME,
-                            'Region': 'USA',
-                            'Unit': 'EJ/yr',
-                            'Variable': 'Final Energy|Buildings|' + sector + '|' + name,
-                            'Scenario': ipcc_scenario_name + ' - 2.5th percentile',
-                            'Year': year_scenario,
-                            'Value': est_2_5_EJ,
-                            }
-                dict_max = {'Model': MODEL_NAME,
-                            'Region': 'USA',
-                            'Unit': 'EJ/yr',
-                            'Variable': 'Final Energy|Buildings|' + sector + '|' + name,
-                            'Scenario': ipcc_scenario_name + ' - 97.5th percentile',
-                            'Year': year_scenario,
-                            'Value': est_97_5_EJ,
-                            }
-                dataframe = pd.DataFrame([dict_mean, dict_min, dict_max])
-                final_df = pd.concat([final_df, dataframe], ignore_index=True)
+        for sector in ACH_PER_SECTOR:
+            data_sector_scenario = data_consumption.loc[sector, scenario]
+            for name, use, unit in zip(['Energy Service|Buildings|' + sector + '|Floor Space',
+                                        'Final Energy|Buildings|' + sector + '|Heating|Space',
+                                        'Final Energy|Buildings|' + sector + '|Cooling'],
+                                       ['GFA_Bm2', 'TOTAL_HEATING_EJ', 'TOTAL_COOLING_EJ'],
+                                       ['bn m2/yr', 'EJ/yr', 'EJ/yr']):
+                for percentile_name, percentile_label in [('percentile_50', ' - 50th percentile'),
+                                                          ('percentile_2.5', ' - 2.5th percentile'),
+                                                          ('percentile_97.5', ' - 97.5th percentile')]:
+                    records.append({'Model': MODEL_NAME,
+                                    'Region': 'USA',
+                                    'Unit': unit,
+                                    'Variable': name,
+                                    'Scenario': ipcc_scenario_name + percentile_label,
+                                    'Year': year_scenario,
+                                    'Value': data_sector_scenario[use, percentile_name],
+                                    })
+    final_df = pd.DataFrame(records)
     result = pd.pivot_table(final_df, values='Value', columns='Year',
                             index=['Model', 'Scenario', 'Region', 'Variable', 'Unit'])
-    result.to_csv(output_path)
+    return result
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Percentiles of the energy consumption per scenario")
+    parser.add_argument("--from-percentiles", action="store_true",
+                        help="read the percentiles saved by step 1 with --aggregate instead of every sample")
+    parser.add_argument("--format", choices=['csv', 'parquet'], default='csv',
+                        help="format of the intermediate and final results, parquet needs pyarrow (default: csv)")
+    args = parser.parse_args()
+
     t0 = time.time()
-    main()
+    main(from_percentiles=args.from_percentiles, result_format=args.format)
     t1 = round((time.time() - t0) / 60, 2)
     print("finished after {} minutes".format(t1))
@@ -22,10 +22,21 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 '''
 
+import hashlib
+import json
 import os
+from collections import deque
+
 import pandas as pd
 import numpy as np
-from pointers import WEATHER_DATA_FOLDER_PATH
+from model.constants import HOURS_OF_THE_YEAR
+from pointers import WEATHER_DATA_FOLDER_PATH, WEATHER_CACHE_FOLDER_PATH
+
+# weather data read by this process, see model/instrumentation.py. "bytes" counts text and binary files,
+# "parsed_bytes" only the text files parsed with pandas and "hashed_bytes" the text files read to hash them
+weather_read_counters = {"files": 0, "bytes": 0, "parsed_files": 0, "parsed_bytes": 0, "hashed_files": 0,
+                         "hashed_bytes": 0}
+
 
 def percentile(n):
     def percentile_(x):
@@ -34,6 +45,27 @@ def percentile(n):
     percentile_.__name__ = 'percentile_%s' % n
     return percentile_
 
+def iter_submitted(executor, function, arguments, max_pending):
+    """
+    (args, function(*args)) for every tuple args of arguments, in their order. Unlike executor.map, which submits
+    every call at once, only max_pending calls are submitted ahead of the result being consumed, and the calls not
+    started yet are cancelled when the consumer stops, e.g., on an error.
+    """
+    pending = deque()
+    try:
+        for args in arguments:
+            pending.append((args, executor.submit(function, *args)))
+            if len(pending) >= max_pending:
+                args, future = pending.popleft()
+                yield args, future.result()
+        while pending:
+            args, future = pending.popleft()
+            yield args, future.result()
+    finally:
+        for args, future in pending:
+            future.cancel()
+
+
 def parse_scenario_name(scenario):
     mapa = {'A1B': 'Medium Impact',
             'A2': 'High Impact',
@@ -42,13 +74,139 @@ def parse_scenario_name(scenario):
     name = scenario.split('_')[-2]
     return mapa[name]
 
-def read_weather_data_scenario(city, scenario):
-    # Quantities
+def read_weather_data_scenario(city, scenario, use_cache=True):
+    weather_file_location = get_weather_file_location(city, scenario)
+    if not use_cache:
+        return parse_weather_file(weather_file_location)
+
+    # read the binary copy of the weather file, (re)building it when the weather file changed
+    weather_cache_location = get_weather_cache_location(city, scenario)
+    if not is_weather_cache_valid(weather_file_location, weather_cache_location):
+        write_weather_cache(weather_file_location, weather_cache_location)
+    weather_data = np.load(weather_cache_location + ".npy", mmap_mode='r')
+    weather_read_counters["files"] += 1
+    weather_read_counters["bytes"] += weather_data.nbytes
+    temperatures_out_C = weather_data[0]
+    relative_humidity_percent = weather_data[1]
+
+    return temperatures_out_C, relative_humidity_percent
+
+
+def get_weather_file_hash(city, scenario):
+    # the hash is kept next to the binary copy of the weather file, so it is only recomputed when the file changed.
+    # Without an up to date copy the file is hashed but not parsed, the copy is built by the process reading the
+    # weather data, e.g., a worker of step 1
+    weather_file_location = get_weather_file_location(city, scenario)
+    weather_cache_location = get_weather_cache_location(city, scenario)
+    if not is_weather_cache_valid(weather_file_location, weather_cache_location):
+        return calc_weather_file_hash(weather_file_location)
+    with open(weather_cache_location + ".json", 'r') as f:
+        weather_file_hash = json.load(f)["sha1"]
+    return weather_file_hash
+
+
+def get_weather_file_location(city, scenario):
     weather_file_name = city.split(",")[0] + "_" + city.split(", ")[-1] + "-hour.dat"
     weather_file_name = weather_file_name.replace(" ", "_")
     weather_file_location = os.path.join(WEATHER_DATA_FOLDER_PATH, scenario, weather_file_name)
-    weather_file = pd.read_csv(weather_file_location, sep='\s+', header=2, skiprows=0)
-    temperatures_out_C = weather_file["Ta"].values[:8760]
-    relative_humidity_percent = weather_file["RH"].values[:8760]
+    return weather_file_location
+
+
+def get_weather_cache_location(city, scenario):
+    weather_file_name = os.path.basename(get_weather_file_location(city, scenario))
+    return os.path.join(WEATHER_CACHE_FOLDER_PATH, scenario, weather_file_name.replace(".dat", ""))
+
+
+def parse_weather_file(weather_file_location):
+    # Quantities
+    weather_file = pd.read_csv(weather_file_location, sep='\s+', header=2, skiprows=0, usecols=["Ta", "RH"],
+                               nrows=HOURS_OF_THE_YEAR)
+    if len(weather_file) < HOURS_OF_THE_YEAR:
+        raise ValueError("the weather file {} has {} hours, {} are needed".format(weather_file_location,
+                                                                                 len(weather_file),
+                                                                                 HOURS_OF_THE_YEAR))
+    file_size = os.path.getsize(weather_file_location)
+    weather_read_counters["files"] += 1
+    weather_read_counters["bytes"] += file_size
+    weather_read_counters["parsed_files"] += 1
+    weather_read_counters["parsed_bytes"] += file_size
+    temperatures_out_C = weather_file["Ta"].values
+    relative_humidity_percent = weather_file["RH"].values
+
+    return temperatures_out_C, relative_humidity_percent
+
+
+def calc_file_hash(file_location):
+    file_hash = hashlib.sha1()
+    with open(file_location, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def calc_weather_file_hash(weather_file_location):
+    file_size = os.path.getsize(weather_file_location)
+    weather_read_counters["files"] += 1
+    weather_read_counters["bytes"] += file_size
+    weather_read_counters["hashed_files"] += 1
+    weather_read_counters["hashed_bytes"] += file_size
+    return calc_file_hash(weather_file_location)
+
+
+def get_file_record(file_location, previous_record=None, hash_function=calc_file_hash):
+    """
+    Modification time, size and sha1 of a file, saved with a copy of its content to tell when the copy is outdated.
+
+    :param previous_record: record saved with the copy. An unchanged modification time and size is trusted and its
+        sha1 is reused, otherwise the content of the file is hashed
+    """
+    file_stat = os.stat(file_location)
+    file_record = {"mtime_ns": file_stat.st_mtime_ns, "size": file_stat.st_size}
+    if previous_record is not None and previous_record.get("mtime_ns") == file_record["mtime_ns"] and \
+            previous_record.get("size") == file_record["size"]:
+        file_record["sha1"] = previous_record["sha1"]
+    else:
+        file_record["sha1"] = hash_function(file_location)
+    return file_record
+
+
+def is_weather_cache_valid(weather_file_location, weather_cache_location):
+    if not os.path.exists(weather_cache_location + ".npy") or not os.path.exists(weather_cache_location + ".json"):
+        return False
+    with open(weather_cache_location + ".json", 'r') as f:
+        weather_cache_metadata = json.load(f)
+
+    weather_file_record = get_file_record(weather_file_location, weather_cache_metadata, calc_weather_file_hash)
+    if weather_file_record["sha1"] != weather_cache_metadata["sha1"]:
+        return False
+    if weather_file_record != weather_cache_metadata:
+        # same content with a new modification time, e.g., after a copy
+        write_json_atomic(weather_cache_location + ".json", weather_file_record)
+    return True
+
+
+def write_weather_cache(weather_file_location, weather_cache_location):
+    weather_file_record = get_file_record(weather_file_location, hash_function=calc_weather_file_hash)
+    temperatures_out_C, relative_humidity_percent = parse_weather_file(weather_file_location)
+
+    os.makedirs(os.path.dirname(weather_cache_location), exist_ok=True)
+    weather_data = np.array([temperatures_out_C, relative_humidity_percent], dtype=np.float64)
+    write_file_atomic(weather_cache_location + ".npy", lambda f: np.save(f, weather_data), mode='wb')
+    write_json_atomic(weather_cache_location + ".json", weather_file_record)
+    return temperatures_out_C, relative_humidity_percent
+
+
+def write_file_atomic(file_location, write_function, mode='w'):
+    # write to a temporary file first, so parallel processes never read a half written file
+    temporary_location = "{}.{}.tmp".format(file_location, os.getpid())
+    try:
+        with open(temporary_location, mode) as f:
+            write_function(f)
+        os.replace(temporary_location, file_location)
+    finally:
+        if os.path.exists(temporary_location):
+            os.remove(temporary_location)
+
 
-    return temperatures_out_C, relative_humidity_percent
\ No newline at end of file
+def write_json_atomic(file_location, data):
+    write_file_atomic(file_location, lambda f: json.dump(data, f))
@@ -31,6 +31,18 @@ T_base_cooling_C = 18.5
 T_base_heating_C = 18.5
 ACH_Commercial = 6.0
 ACH_Residential = 4.0
+ACH_PER_SECTOR = {'Residential': ACH_Residential, 'Commercial': ACH_Commercial}  # building classes of the model
+HOURS_OF_THE_YEAR = 8760
+RESULT_CACHE_MAX_ENTRIES = 1000000
+PAIRS_PER_TASK = 16  # (city, scenario) pairs sent to a worker process at once, lost with the task on an error
+JOURNAL_SYNC_EVERY = 64  # (city, scenario) pairs appended to the journal between two writes to the disk
+MONTECARLO_N_SAMPLES = 100
+MONTECARLO_SEED = 0
+MONTECARLO_CHUNK_SIZE = 100000  # samples per scenario and sector held in memory at once
+PERCENTILES = [50, 2.5, 97.5]
+QUANTILE_SKETCH_COMPRESSION = 500
+MONTECARLO_JOINT_CHUNK_SIZE = 10000  # joint samples held in memory at once, per worker
+MONTECARLO_WEIGHT_CONCENTRATION = 100  # concentration of the dirichlet distribution of the climate region weights
 ZONE_NAMES = {"Hot-humid": ["1A", "2A", "3A"],
               "Hot-dry": ["2B", "3B"],
               "Hot-marine": ["3C"],
@@ -0,0 +1,196 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import numpy as np
+from enthalpygradients.constants import AIR_DENSITY_DEFAULT_kgm3, STOREY_HEIGHT_DEFAULT_m, HOURS_OF_THE_DAY
+from enthalpygradients.functions import calc_h_lat, calc_h_sen
+
+from model.constants import COP_cooling, COP_heating, RH_base_cooling_perc, RH_base_heating_perc, T_base_cooling_C, \
+    T_base_heating_C, ACH_Residential, ACH_Commercial, HOURS_OF_THE_YEAR
+
+# order of the load types along the last axis of the batched results
+LOAD_TYPES = ['cooling', 'dehumidification', 'heating', 'humidification']
+PATM_mbar = 1013.25
+
+
+def calc_humidity_ratio(rh_percent, dry_bulb_C, patm_mbar=PATM_mbar):
+    """
+    Vectorized version of enthalpygradients.functions.calc_humidity_ratio
+    """
+    dry_bulb_C = np.asarray(dry_bulb_C, dtype=np.float64)
+    if np.any((dry_bulb_C < -70) | (dry_bulb_C > 50)):
+        raise ValueError("The temperature indicated is out of bounds (-70, 50) degrees celsius")
+
+    # psychrometric constants above and below -20 degrees celsius
+    above = dry_bulb_C >= -20
+    m = np.where(above, 7.591386, 9.778707)
+    Tn = np.where(above, 240.7263, 273.1466)
+    A = np.where(above, 6.116441, 6.114742)
+
+    p_ws_hPa = A * 10 ** ((m * dry_bulb_C) / (dry_bulb_C + Tn))
+    p_w_hPa = p_ws_hPa * rh_percent / 100
+    B_kgperkg = 0.6219907
+    x_kgperkg = B_kgperkg * p_w_hPa / (patm_mbar - p_w_hPa)
+    return x_kgperkg
+
+
+def calc_hourly_enthalpy_gradients(T_out_C, RH_out_C, T_base_C, RH_base_perc, patm_mbar=PATM_mbar):
+    """
+    Sensible and latent enthalpy gradients between outdoor and indoor air [kJ/kg], hour by hour.
+    Positive values ask for cooling / dehumidification, negative values for heating / humidification.
+    """
+    x_indoor_kg_kg = calc_humidity_ratio(RH_base_perc, T_base_C, patm_mbar)
+    x_outdoor_kg_kg = calc_humidity_ratio(RH_out_C, T_out_C, patm_mbar)
+    AH_sensible_kJ_kg = calc_h_sen(T_out_C) - calc_h_sen(T_base_C)
+    AH_latent_kJ_kg = calc_h_lat(T_out_C, x_outdoor_kg_kg) - calc_h_lat(T_base_C, x_indoor_kg_kg)
+    return AH_sensible_kJ_kg, AH_latent_kJ_kg
+
+
+def calc_daily_enthalpy_gradients(T_out_C, RH_out_C,
+                                  T_base_cooling_C=T_base_cooling_C, RH_base_cooling_perc=RH_base_cooling_perc,
+                                  T_base_heating_C=T_base_heating_C, RH_base_heating_perc=RH_base_heating_perc):
+    """
+    Daily enthalpy gradients [kJ/kg day] of every load type in LOAD_TYPES.
+
+    :param T_out_C: outdoor temperature, array of shape (..., hours), one year of hourly data
+    :param RH_out_C: outdoor relative humidity, array of the same shape as T_out_C
+    :return: array of shape (..., 4)
+    """
+    return np.concatenate([calc_daily_cooling_gradients(T_out_C, RH_out_C, T_base_cooling_C, RH_base_cooling_perc),
+                           calc_daily_heating_gradients(T_out_C, RH_out_C, T_base_heating_C, RH_base_heating_perc)],
+                          axis=-1)
+
+
+def calc_daily_cooling_gradients(T_out_C, RH_out_C, T_base_C=T_base_cooling_C, RH_base_perc=RH_base_cooling_perc):
+    """
+    Daily enthalpy gradients [kJ/kg day] of cooling and dehumidification, array of shape (..., 2)
+    """
+    AH_sensible_kJ_kg, AH_latent_kJ_kg = calc_hourly_enthalpy_gradients(*check_hourly_data(T_out_C, RH_out_C),
+                                                                        T_base_C, RH_base_perc)
+    cooling = np.clip(AH_sensible_kJ_kg, 0.0, None).sum(axis=-1)
+    dehumidification = np.clip(AH_latent_kJ_kg, 0.0, None).sum(axis=-1)
+    return np.stack([cooling, dehumidification], axis=-1) / HOURS_OF_THE_DAY
+
+
+def calc_daily_heating_gradients(T_out_C, RH_out_C, T_base_C=T_base_heating_C, RH_base_perc=RH_base_heating_perc):
+    """
+    Daily enthalpy gradients [kJ/kg day] of heating and humidification, array of shape (..., 2)
+    """
+    AH_sensible_kJ_kg, AH_latent_kJ_kg = calc_hourly_enthalpy_gradients(*check_hourly_data(T_out_C, RH_out_C),
+                                                                        T_base_C, RH_base_perc)
+    heating = -np.clip(AH_sensible_kJ_kg, None, 0.0).sum(axis=-1)
+    humidification = -np.clip(AH_latent_kJ_kg, None, 0.0).sum(axis=-1)
+    return np.stack([heating, humidification], axis=-1) / HOURS_OF_THE_DAY
+
+
+def check_hourly_data(T_out_C, RH_out_C):
+    T_out_C = np.asarray(T_out_C, dtype=np.float64)
+    RH_out_C = np.asarray(RH_out_C, dtype=np.float64)
+    if T_out_C.shape != RH_out_C.shape:
+        raise ValueError("your data does not have the same length, we cannot calculate daily enthalpy gradients")
+    if T_out_C.shape[-1] != HOURS_OF_THE_YEAR:
+        # the consumption is per year, a short or empty year would give a consumption that is too low
+        raise ValueError("your data does not have {} hours, we cannot calculate daily enthalpy gradients".format(
+            HOURS_OF_THE_YEAR))
+    return T_out_C, RH_out_C
+
+
+def calc_consumption_factor(ACH, COP):
+    """
+    Factor [kWh/m2 yr per kJ/kg day] between a daily enthalpy gradient and the specific thermal consumption.
+    ACH and COP can be arrays, the factor is broadcast.
+    """
+    return (STOREY_HEIGHT_DEFAULT_m * AIR_DENSITY_DEFAULT_kgm3 * HOURS_OF_THE_DAY * np.asarray(ACH, dtype=np.float64)
+            / (np.asarray(COP, dtype=np.float64) * 3600))
+
+
+def calc_specific_thermal_consumption_batch(T_out_C, RH_out_C, ACH=(ACH_Residential, ACH_Commercial),
+                                            COP_cooling=COP_cooling, COP_heating=COP_heating,
+                                            T_base_cooling_C=T_base_cooling_C,
+                                            RH_base_cooling_perc=RH_base_cooling_perc,
+                                            T_base_heating_C=T_base_heating_C,
+                                            RH_base_heating_perc=RH_base_heating_perc):
+    """
+    Specific thermal consumption [kWh/m2 yr] of every load type in LOAD_TYPES and every air change rate in ACH,
+    in one pass over the hourly data. It gives the same results as one call of
+    EnthalpyGradient.specific_thermal_consumption(how='daily') per load type and air change rate.
+
+    :param T_out_C: outdoor temperature, array of shape (n, hours), one year of hourly data per row, e.g., per city
+    :param RH_out_C: outdoor relative humidity, array of the same shape as T_out_C
+    :return: array of shape (n, len(ACH), 4)
+    """
+    daily_enthalpy_gradients_kJ_kg = calc_daily_enthalpy_gradients(T_out_C, RH_out_C,
+                                                                   T_base_cooling_C, RH_base_cooling_perc,
+                                                                   T_base_heating_C, RH_base_heating_perc)
+
+    # ACH and COP only scale the gradients
+    COP = np.array([COP_cooling, COP_cooling, COP_heating, COP_heating])
+    factor = calc_consumption_factor(np.asarray(ACH, dtype=np.float64)[:, np.newaxis], COP)
+    return daily_enthalpy_gradients_kJ_kg[..., np.newaxis, :] * factor
+
+
+def calc_hourly_specific_thermal_consumption(T_out_C, RH_out_C, ACH=(ACH_Residential, ACH_Commercial),
+                                             COP_cooling=COP_cooling, COP_heating=COP_heating,
+                                             T_base_cooling_C=T_base_cooling_C,
+                                             RH_base_cooling_perc=RH_base_cooling_perc,
+                                             T_base_heating_C=T_base_heating_C,
+                                             RH_base_heating_perc=RH_base_heating_perc):
+    """
+    Specific thermal consumption [kWh/m2] of every load type in LOAD_TYPES and every air change rate in ACH, hour
+    by hour. The sum over the hours is the result of calc_specific_thermal_consumption_batch.
+
+    :param T_out_C: outdoor temperature, array of shape (n, hours), one year of hourly data per row
+    :param RH_out_C: outdoor relative humidity, array of the same shape as T_out_C
+    :return: array of shape (n, len(ACH), 4, hours)
+    """
+    T_out_C, RH_out_C = check_hourly_data(T_out_C, RH_out_C)
+    AH_sensible_cooling_kJ_kg, AH_latent_cooling_kJ_kg = calc_hourly_enthalpy_gradients(T_out_C, RH_out_C,
+                                                                                        T_base_cooling_C,
+                                                                                        RH_base_cooling_perc)
+    AH_sensible_heating_kJ_kg, AH_latent_heating_kJ_kg = calc_hourly_enthalpy_gradients(T_out_C, RH_out_C,
+                                                                                        T_base_heating_C,
+                                                                                        RH_base_heating_perc)
+    hourly_enthalpy_gradients_kJ_kg = np.stack([np.clip(AH_sensible_cooling_kJ_kg, 0.0, None),
+                                                np.clip(AH_latent_cooling_kJ_kg, 0.0, None),
+                                                -np.clip(AH_sensible_heating_kJ_kg, None, 0.0),
+                                                -np.clip(AH_latent_heating_kJ_kg, None, 0.0)], axis=-2)
+    hourly_enthalpy_gradients_kJ_kg = hourly_enthalpy_gradients_kJ_kg / HOURS_OF_THE_DAY
+
+    # ACH and COP only scale the gradients
+    COP = np.array([COP_cooling, COP_cooling, COP_heating, COP_heating])
+    factor = calc_consumption_factor(np.asarray(ACH, dtype=np.float64)[:, np.newaxis], COP)
+    return hourly_enthalpy_gradients_kJ_kg[..., np.newaxis, :, :] * factor[..., np.newaxis]
+
+
+def calc_total_heating_cooling(specific_thermal_consumption, axis=-1):
+    """
+    Total heating (sensible and latent heating) and total cooling (sensible cooling and dehumidification) of a
+    result of calc_specific_thermal_consumption_batch or calc_hourly_specific_thermal_consumption.
+
+    :param specific_thermal_consumption: array with the load types of LOAD_TYPES along axis
+    :param axis: axis of the load types
+    :return: array of the same shape with [heating, cooling] along axis instead of the 4 load types
+    """
+    sensible_cooling, latent_cooling, sensible_heating, latent_heating = np.moveaxis(specific_thermal_consumption,
+                                                                                     axis, 0)
+    return np.stack([sensible_heating + latent_heating, sensible_cooling + latent_cooling], axis=axis)
@@ -0,0 +1,176 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import cProfile
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from model.auxiliary import weather_read_counters
+
+# fields of the pair and read events summed up in the event of the stage they belong to
+EVENT_TOTALS = ["read_seconds", "kernel_seconds", "weather_bytes", "parsed_bytes", "hashed_bytes"]
+
+
+class Instrumentation(object):
+    """
+    Collects timing and counters of a run as events:
+
+    - one 'stage' event per stage, with its wall-clock time, the rows it produced, its peak memory when
+      measure_memory is set, and the sum of the pair events that happened during the stage,
+    - one 'pair' event per (city, scenario) pair, with the time spent reading the weather file and in the enthalpy
+      gradient kernel, and the bytes of weather data read,
+    - one 'read' event per block of the main process reading weather data outside of the pairs, e.g., hashing the
+      weather files to look up the result cache. It counts as read time of the stage.
+
+    Every event is passed to callback (if given) as soon as it happens, and can be written as a trace with
+    write_trace.
+    """
+
+    def __init__(self, callback=None, measure_memory=False):
+        self.callback = callback
+        self.measure_memory = measure_memory
+        self.events = []
+        self.origin = time.perf_counter()
+        self._open_stages = []
+
+    def emit(self, event):
+        self.events.append(event)
+        for stage_totals in self._open_stages:
+            if event["type"] == "pair":
+                stage_totals["pairs"] += 1
+                stage_totals["cached_pairs"] += int(event.get("cached", False))
+            if event["type"] in ["pair", "read"]:
+                for field in EVENT_TOTALS:
+                    stage_totals[field] += event.get(field, 0)
+        if self.callback is not None:
+            self.callback(event)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Times the stage. The caller can add fields to the event through the yielded dictionary, e.g., rows.
+        """
+        metrics = {}
+        stage_totals = dict({"pairs": 0, "cached_pairs": 0}, **{field: 0 for field in EVENT_TOTALS})
+        self._open_stages.append(stage_totals)
+        if self.measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            seconds = time.perf_counter() - start
+            event = {"type": "stage", "name": name, "start": start - self.origin, "seconds": seconds}
+            if self.measure_memory:
+                event["peak_memory_MB"] = tracemalloc.get_traced_memory()[1] / 1E6
+                tracemalloc.stop()
+            self._open_stages.remove(stage_totals)
+            if stage_totals["pairs"] or stage_totals["read_seconds"]:
+                # the rest of the stage is overhead: pandas, caches and, with workers, waiting for results
+                event.update(stage_totals)
+                event["overhead_seconds"] = max(0.0, seconds - stage_totals["read_seconds"] -
+                                                stage_totals["kernel_seconds"])
+            event.update(metrics)
+            self.emit(event)
+
+    def pair(self, city, scenario, **metrics):
+        end = time.perf_counter() - self.origin
+        event = {"type": "pair", "name": "{} / {}".format(city, scenario), "city": city, "scenario": scenario,
+                 "start": end - metrics.get("seconds", 0.0)}
+        event.update(metrics)
+        self.emit(event)
+
+    @contextmanager
+    def reading(self, name):
+        """
+        Times a block reading weather data in this process outside of the pairs, with the bytes it read
+        """
+        counters_before = dict(weather_read_counters)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.emit({"type": "read", "name": name, "start": start - self.origin, "seconds": seconds,
+                       "read_seconds": seconds,
+                       "files": weather_read_counters["files"] - counters_before["files"],
+                       "weather_bytes": weather_read_counters["bytes"] - counters_before["bytes"],
+                       "parsed_bytes": weather_read_counters["parsed_bytes"] - counters_before["parsed_bytes"],
+                       "hashed_bytes": weather_read_counters["hashed_bytes"] - counters_before["hashed_bytes"]})
+
+    def stage_events(self):
+        return [event for event in self.events if event["type"] == "stage"]
+
+    def write_trace(self, file_location):
+        """
+        Writes the events in the Trace Event Format, which chrome://tracing and https://ui.perfetto.dev display.
+        Stages, pairs and reads are shown in three rows.
+        """
+        trace_events = []
+        for event in self.events:
+            if event.get("cached", False):
+                continue
+            trace_events.append({"name": event["name"],
+                                 "cat": event["type"],
+                                 "ph": "X",
+                                 "ts": event["start"] * 1E6,
+                                 "dur": event.get("seconds", 0.0) * 1E6,
+                                 "pid": os.getpid(),
+                                 "tid": ["stage", "pair", "read"].index(event["type"]),
+                                 "args": {key: value for key, value in event.items()
+                                          if key not in ["type", "name", "start", "seconds"]}})
+        with open(file_location, 'w') as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+    def print_summary(self):
+        print("{:<30} {:>10} {:>10} {:>10} {:>10} {:>12} {:>10}".format(
+            "stage", "time [s]", "rows", "read [s]", "kernel [s]", "weather [MB]", "peak [MB]"))
+        for event in self.stage_events():
+            print("{:<30} {:>10.2f} {:>10} {:>10} {:>10} {:>12} {:>10}".format(
+                event["name"], event["seconds"], event.get("rows", ""),
+                "{:.2f}".format(event["read_seconds"]) if "read_seconds" in event else "",
+                "{:.2f}".format(event["kernel_seconds"]) if "kernel_seconds" in event else "",
+                "{:.1f}".format(event["weather_bytes"] / 1E6) if "weather_bytes" in event else "",
+                "{:.1f}".format(event["peak_memory_MB"]) if "peak_memory_MB" in event else ""))
+        print("{:<30} {:>10.2f}".format("total", sum(event["seconds"] for event in self.stage_events())))
+
+
+@contextmanager
+def profiled(file_location=None, top=25):
+    """
+    Runs the block under cProfile, prints the functions with the largest cumulative time and, if file_location is
+    given, saves the statistics for snakeviz, pstats, etc.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if file_location is not None:
+            profiler.dump_stats(file_location)
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(top)
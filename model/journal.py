@@ -0,0 +1,141 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import os
+import pickle
+import struct
+import zlib
+
+import numpy as np
+
+from model.constants import JOURNAL_SYNC_EVERY
+from pointers import JOURNAL_FILE_PATH
+
+# change when the records change, older journals are then not resumed
+JOURNAL_VERSION = 2
+
+# every record starts with the length and the crc32 of its pickled content
+RECORD_HEADER = struct.Struct("<II")
+
+
+class Journal(object):
+    """
+    Append-only file of the (city, scenario) pairs completed by step 1, so an interrupted run can resume where it
+    stopped. The first record holds the constants of the run, the next ones (city, scenario, hash of the weather
+    file, energy intensities). A pair is only reused with the same weather file, see get.
+
+    Every record is flushed as soon as it is written, so it survives the end of the process, and written to the disk
+    every sync_every records. A record cut by a crash fails its check and is dropped, with everything after it,
+    when the journal is resumed.
+    """
+
+    def __init__(self, path=JOURNAL_FILE_PATH, constants=None, resume=False, sync_every=JOURNAL_SYNC_EVERY):
+        """
+        :param constants: constants of the run, a journal written with other constants is not resumed
+        :param resume: keep the pairs of an existing journal instead of starting a new one
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.n_unsynced = 0
+        self.completed = {}
+        header = {"version": JOURNAL_VERSION, "constants": constants}
+
+        records, end = read_journal_records(path) if resume and os.path.exists(path) else ([], 0)
+        if records:
+            if records[0] != header:
+                raise ValueError("the journal {} was written by a run with other constants, run without resume "
+                                 "to start again".format(path))
+            self.completed = {(city, scenario): (weather_file_hash, values)
+                              for city, scenario, weather_file_hash, values in records[1:]}
+            self.file = open(path, 'r+b')
+            self.file.truncate(end)
+            self.file.seek(end)
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.file = open(path, 'wb')
+            self._write(header)
+            self.sync()
+
+    def get(self, city, scenario, weather_file_hash):
+        """
+        :return: energy intensities of the pair, None when it is not in the journal or its weather file changed
+        """
+        journaled_hash, values = self.completed.get((city, scenario), (None, None))
+        return values if journaled_hash == weather_file_hash else None
+
+    def append(self, city, scenario, weather_file_hash, values):
+        values = np.asarray(values, dtype=np.float64)
+        self._write((city, scenario, weather_file_hash, values))
+        self.completed[(city, scenario)] = (weather_file_hash, values)
+        self.n_unsynced += 1
+        if self.n_unsynced >= self.sync_every:
+            self.sync()
+
+    def _write(self, record):
+        content = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.write(RECORD_HEADER.pack(len(content), zlib.crc32(content)) + content)
+        self.file.flush()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.n_unsynced = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def remove(self):
+        # once its pairs are in the intermediate result, the journal is not needed anymore
+        self.close()
+        os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_journal_records(path):
+    """
+    :return: the records up to the first incomplete or corrupted one, and the position where it starts
+    """
+    records = []
+    end = 0
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            length, crc = RECORD_HEADER.unpack(header)
+            content = f.read(length)
+            if len(content) < length or zlib.crc32(content) != crc:
+                break
+            try:
+                records.append(pickle.loads(content))
+            except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError):
+                break
+            end = f.tell()
+    return records, end
@@ -0,0 +1,108 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import os
+import pickle
+from typing import NamedTuple, Dict
+
+import numpy as np
+import pandas as pd
+
+from model.auxiliary import get_file_record, write_file_atomic
+from pointers import METADATA_FILE_PATH
+
+# change it when the fields of Metadata change, older snapshots are then parsed again
+METADATA_SNAPSHOT_VERSION = 2
+
+
+class Metadata(NamedTuple):
+    """
+    Content of metadata.xlsx used by the model
+    """
+    scenarios_array: np.ndarray  # SCENARIOS sheet, name of every scenario
+    cities_array: np.ndarray  # CITIES sheet, name of every city
+    climate_region_array: np.ndarray  # CITIES sheet, climate region of every city
+    city_climate_dict: Dict[str, str]  # CITIES sheet, climate region of every city by name
+    floor_area_predictions_df: pd.DataFrame  # FLOOR_AREA sheet, indexed by year
+    floor_area_climate_df: pd.DataFrame  # FLOOR_AREA_CLIMATE sheet, indexed by climate region
+
+
+def load_metadata(metadata_file_path=METADATA_FILE_PATH, use_snapshot=True):
+    """
+    Content of the workbook. Parsing it with openpyxl is slow, so a binary snapshot is saved next to it and loaded
+    instead as long as the workbook does not change.
+    """
+    if not use_snapshot:
+        return parse_metadata(metadata_file_path)
+
+    snapshot_location = get_metadata_snapshot_location(metadata_file_path)
+    snapshot = read_metadata_snapshot(snapshot_location)
+    metadata_file_record = get_file_record(metadata_file_path, None if snapshot is None else snapshot["file"])
+    if snapshot is not None and metadata_file_record["sha1"] == snapshot["file"]["sha1"]:
+        if metadata_file_record != snapshot["file"]:
+            # same content with a new modification time, e.g., after a copy
+            write_metadata_snapshot(snapshot_location, snapshot["metadata"], metadata_file_record)
+        return snapshot["metadata"]
+
+    metadata = parse_metadata(metadata_file_path)
+    write_metadata_snapshot(snapshot_location, metadata, metadata_file_record)
+    return metadata
+
+
+def parse_metadata(metadata_file_path=METADATA_FILE_PATH):
+    # the workbook is opened and parsed only once for all the sheets
+    sheets = pd.read_excel(metadata_file_path, sheet_name=['SCENARIOS', 'CITIES', 'FLOOR_AREA', 'FLOOR_AREA_CLIMATE'])
+    return Metadata(scenarios_array=sheets['SCENARIOS']['SCENARIO'].values,
+                    cities_array=sheets['CITIES']['CITY'].values,
+                    climate_region_array=sheets['CITIES']['Climate Region'].values,
+                    city_climate_dict=dict(zip(sheets['CITIES']['CITY'], sheets['CITIES']['Climate Region'])),
+                    floor_area_predictions_df=sheets['FLOOR_AREA'].set_index('year'),
+                    floor_area_climate_df=sheets['FLOOR_AREA_CLIMATE'].set_index('Climate Region'))
+
+
+def get_metadata_snapshot_location(metadata_file_path):
+    return os.path.splitext(metadata_file_path)[0] + ".pkl"
+
+
+def read_metadata_snapshot(snapshot_location):
+    # a missing, unreadable or outdated snapshot is parsed again
+    try:
+        with open(snapshot_location, 'rb') as f:
+            snapshot = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != METADATA_SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def write_metadata_snapshot(snapshot_location, metadata, metadata_file_record):
+    snapshot = {"version": METADATA_SNAPSHOT_VERSION,
+                "file": metadata_file_record,
+                "metadata": metadata}
+    try:
+        write_file_atomic(snapshot_location,
+                          lambda f: pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL), mode='wb')
+    except OSError:
+        # e.g., a read-only data folder, the workbook is then parsed on every run
+        pass
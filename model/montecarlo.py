@@ -0,0 +1,72 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import numpy as np
+
+from model.constants import MONTECARLO_N_SAMPLES, MONTECARLO_SEED, MONTECARLO_CHUNK_SIZE
+
+
+def iter_normal_samples(mean, std, n_samples=MONTECARLO_N_SAMPLES, seed=MONTECARLO_SEED,
+                        chunk_size=MONTECARLO_CHUNK_SIZE):
+    """
+    Draws n_samples normal samples for every element of mean / std (e.g., one per scenario and sector), in chunks
+    of at most chunk_size samples so the memory stays bounded for large sample counts.
+
+    The standard normal values are drawn sample by sample, so the samples are the same for any chunk size and
+    for a given seed.
+
+    :param mean: array of shape (n_scenarios, n_sectors)
+    :param std: array of the same shape as mean
+    :return: generator of arrays of shape (n_scenarios, n_sectors, samples in the chunk)
+    """
+    mean = np.asarray(mean, dtype=np.float64)
+    std = np.asarray(std, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    for start in range(0, n_samples, chunk_size):
+        z = rng.standard_normal((min(chunk_size, n_samples - start),) + mean.shape)
+        yield mean[..., np.newaxis] + std[..., np.newaxis] * np.moveaxis(z, 0, -1)
+
+
+def draw_normal_samples(mean, std, n_samples=MONTECARLO_N_SAMPLES, seed=MONTECARLO_SEED,
+                        chunk_size=MONTECARLO_CHUNK_SIZE):
+    """
+    All the chunks of iter_normal_samples in one array of shape (n_scenarios, n_sectors, n_samples)
+    """
+    samples = np.empty(np.shape(mean) + (n_samples,))
+    start = 0
+    for chunk in iter_normal_samples(mean, std, n_samples, seed, chunk_size):
+        samples[..., start:start + chunk.shape[-1]] = chunk
+        start += chunk.shape[-1]
+    return samples
+
+
+def get_floor_area_distribution(floor_area_predictions_df, years, sectors):
+    """
+    Mean and standard deviation of the gross floor area [m2] per year and sector
+
+    :return: two arrays of shape (len(years), len(sectors))
+    """
+    data_floor_area = floor_area_predictions_df.loc[[float(year) for year in years]]
+    mean_m2 = np.stack([data_floor_area['GFA_mean_' + sector + '_m2'].values for sector in sectors], axis=1)
+    std_m2 = np.stack([data_floor_area['GFA_sd_' + sector + '_m2'].values for sector in sectors], axis=1)
+    return mean_m2.astype(np.float64), std_m2.astype(np.float64)
@@ -0,0 +1,182 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import numpy as np
+import pandas as pd
+
+from model.constants import PERCENTILES, QUANTILE_SKETCH_COMPRESSION
+from model.result_io import COLUMN_LEVEL_SEPARATOR, get_result_format, read_results
+
+# variables of the montecarlo simulation summarized with percentiles
+VALUE_COLUMNS = ["GFA_Bm2", "TOTAL_HEATING_EJ", "TOTAL_COOLING_EJ"]
+
+
+def get_percentile_name(n):
+    # same names as the columns created with model.auxiliary.percentile
+    return 'percentile_%s' % n
+
+
+class QuantileSketch(object):
+    """
+    Mergeable sketch of a distribution (a t-digest with the k1 scale function). It keeps at most ~compression
+    centroids, with a finer resolution in the tails, so percentiles of any number of samples are estimated in a
+    bounded memory. Two sketches of different chunks of the same samples can be merged.
+    """
+
+    def __init__(self, compression=QUANTILE_SKETCH_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        values = np.ravel(values).astype(np.float64)
+        if values.size == 0:
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(values.size)]))
+
+    def merge(self, other):
+        if other.weights.size == 0:
+            return
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]),
+                       np.concatenate([self.weights, other.weights]))
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='mergesort')
+        means = means[order]
+        weights = weights[order]
+
+        # each centroid gathers the points whose cumulative weight falls within one unit of the scale function
+        cumulative_weight = np.cumsum(weights)
+        q_left = (cumulative_weight - weights) / cumulative_weight[-1]
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q_left - 1)
+        centroid = np.floor(k - k[0]).astype(np.int64)
+        centroid = np.unique(centroid, return_inverse=True)[1]
+        self.weights = np.bincount(centroid, weights=weights)
+        self.means = np.bincount(centroid, weights=weights * means) / self.weights
+
+    def quantile(self, q):
+        """
+        :param q: quantile(s) between 0 and 1
+        """
+        if self.weights.size == 0:
+            return np.full(np.shape(q), np.nan)
+        # ranks from 0 to n - 1 as the linear interpolation of np.percentile: a centroid is placed at the mean rank
+        # of its samples, so centroids of a single sample give the exact percentiles
+        cumulative_weight = np.cumsum(self.weights)
+        last_rank = cumulative_weight[-1] - 1
+        centers = cumulative_weight - (self.weights + 1) / 2
+        return np.interp(np.asarray(q) * last_rank,
+                         np.concatenate([[0.0], centers, [last_rank]]),
+                         np.concatenate([[self.min], self.means, [self.max]]))
+
+    def percentile(self, n):
+        return self.quantile(np.asarray(n) / 100.0)
+
+
+class PercentileAccumulator(object):
+    """
+    Percentiles of samples that arrive in chunks of shape (n_scenarios, n_sectors, samples in the chunk).
+
+    method='exact' keeps every sample and gives the same result as np.percentile over all of them.
+    method='tdigest' keeps one QuantileSketch per scenario and sector, so the memory does not grow with the samples.
+    """
+
+    def __init__(self, shape, method='exact', compression=QUANTILE_SKETCH_COMPRESSION):
+        if method not in ['exact', 'tdigest']:
+            raise ValueError("valid methods are {}".format(['exact', 'tdigest']))
+        self.shape = tuple(shape)
+        self.method = method
+        self.chunks = []
+        self.sketches = [QuantileSketch(compression) for _ in range(int(np.prod(self.shape)))]
+
+    def update(self, chunk):
+        chunk = np.reshape(chunk, (-1, np.shape(chunk)[-1]))
+        if self.method == 'exact':
+            self.chunks.append(chunk)
+        else:
+            for sketch, values in zip(self.sketches, chunk):
+                sketch.update(values)
+
+    def merge(self, other):
+        if self.method == 'exact':
+            self.chunks.extend(other.chunks)
+        else:
+            for sketch, other_sketch in zip(self.sketches, other.sketches):
+                sketch.merge(other_sketch)
+
+    def percentile(self, percentiles=PERCENTILES):
+        """
+        :return: array of shape self.shape + (len(percentiles),)
+        """
+        if self.method == 'exact':
+            result = np.percentile(np.concatenate(self.chunks, axis=-1), percentiles, axis=-1)
+            result = np.moveaxis(result, 0, -1)
+        else:
+            result = np.array([sketch.percentile(percentiles) for sketch in self.sketches])
+        return result.reshape(self.shape + (len(percentiles),))
+
+
+def calc_percentiles_per_group(data_consumption, percentiles=PERCENTILES):
+    """
+    Percentiles of the montecarlo samples per building class and scenario, from the table of samples.
+
+    :return: dataframe indexed by (BUILDING_CLASS, SCENARIO) with columns (variable, percentile_n)
+    """
+    data_percentiles = data_consumption.groupby(["BUILDING_CLASS", "SCENARIO"])[VALUE_COLUMNS].quantile(
+        [n / 100.0 for n in percentiles])
+    data_percentiles = data_percentiles.unstack(level=-1)
+    data_percentiles.columns = pd.MultiIndex.from_tuples(
+        [(use, get_percentile_name(n)) for use, q in data_percentiles.columns for n in percentiles
+         if np.isclose(q, n / 100.0)])
+    return data_percentiles
+
+
+def build_percentiles_df(values, scenarios_array, sectors, percentiles=PERCENTILES):
+    """
+    Same table as calc_percentiles_per_group, from arrays of percentiles.
+
+    :param values: dictionary variable -> array of shape (n_scenarios, n_sectors, len(percentiles))
+    """
+    index = pd.MultiIndex.from_tuples([(sector, scenario) for scenario in scenarios_array for sector in sectors],
+                                      names=["BUILDING_CLASS", "SCENARIO"])
+    columns = pd.MultiIndex.from_tuples([(use, get_percentile_name(n)) for use in values for n in percentiles])
+    data = np.concatenate([np.reshape(array, (-1, len(percentiles))) for array in values.values()], axis=1)
+    return pd.DataFrame(data, index=index, columns=columns).sort_index()
+
+
+def read_percentiles(file_location):
+    if get_result_format(file_location) == 'csv':
+        return pd.read_csv(file_location, header=[0, 1], index_col=[0, 1])
+
+    # parquet stores the column names as variable|percentile_n
+    data_percentiles = read_results(file_location).set_index(["BUILDING_CLASS", "SCENARIO"])
+    data_percentiles.columns = pd.MultiIndex.from_tuples([tuple(column.split(COLUMN_LEVEL_SEPARATOR))
+                                                          for column in data_percentiles.columns])
+    return data_percentiles
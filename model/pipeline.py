@@ -0,0 +1,207 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import argparse
+import importlib
+from contextlib import nullcontext
+from typing import NamedTuple, List
+
+import pandas as pd
+
+from model.constants import ACH_PER_SECTOR, MONTECARLO_N_SAMPLES, MONTECARLO_SEED
+from model.instrumentation import Instrumentation, profiled
+from model.metadata import load_metadata
+from model.percentiles import calc_percentiles_per_group
+from model.result_cache import ResultCache
+from model.result_io import get_result_format, write_results, with_result_format
+from model.streaming import calc_weighted_average_streaming
+from model.uncertainty import UNCERTAINTY_SOURCES, calc_joint_percentiles_per_scenario
+from pointers import METADATA_FILE_PATH, INTERMEDIATE_RESULT_FILE_PATH, INTERMEDIATE_PERCENTILES_FILE_PATH, \
+    FINAL_RESULT_FILE_PATH
+
+# the two steps of the model are scripts, their names are not valid identifiers for an import statement
+inference = importlib.import_module("model.1_prepare_data_and_inference")
+prediction = importlib.import_module("model.2_prediction")
+
+
+class StageReport(NamedTuple):
+    stage: str
+    seconds: float
+    peak_memory_MB: float  # peak of the memory allocated in the main process, nan when not measured
+
+
+class PipelineResult(NamedTuple):
+    final_result_df: pd.DataFrame  # same table as results/final_result.csv
+    data_consumption: pd.DataFrame  # percentiles per building class and scenario
+    stage_reports: List[StageReport]
+
+
+def run_pipeline(workers=1, use_cache=True, n_samples=MONTECARLO_N_SAMPLES, seed=MONTECARLO_SEED,
+                 aggregate='auto', write_intermediate=False, output_path=FINAL_RESULT_FILE_PATH, result_format=None,
+                 metadata_file_path=METADATA_FILE_PATH, measure_memory=False, instrumentation=None,
+                 stream=False, city_results_path=None, joint_uncertainty=None):
+    """
+    Runs step 1 and step 2 of the model in one process, handing the results of step 1 to step 2 in memory.
+
+    :param aggregate: None keeps every montecarlo sample in a table (as step 1 without --aggregate), 'exact' or
+        'tdigest' only keep their percentiles. 'auto' is 'exact', or 'tdigest' with joint_uncertainty
+    :param write_intermediate: also write the intermediate result of step 1 to disk
+    :param output_path: where the final result is written, None to skip writing it
+    :param result_format: 'csv' or 'parquet', by default the format follows the extension of output_path
+    :param measure_memory: measure the peak memory of every stage with tracemalloc, which slows the run down
+    :param instrumentation: Instrumentation collecting the events of the run, e.g., with a callback or to write a
+        trace. By default a new one is created with measure_memory
+    :param stream: compute the (city, scenario) pairs in batches folded into the weighted average right away, with a
+        memory that does not depend on the number of cities. The result cache is not used
+    :param city_results_path: with stream, also write the rows per city to this CSV file
+    :param joint_uncertainty: sources of uncertainty sampled together (see model.uncertainty.UNCERTAINTY_SOURCES)
+        instead of the built area alone. It needs the rows per city, so it does not work with stream, and only the
+        percentiles are kept ('tdigest' when aggregate is 'auto' or None)
+    :return: PipelineResult
+    """
+    if instrumentation is None:
+        instrumentation = Instrumentation(measure_memory=measure_memory)
+    if aggregate == 'auto':
+        aggregate = 'exact' if joint_uncertainty is None else 'tdigest'
+    if joint_uncertainty is not None:
+        if stream:
+            raise ValueError("the joint uncertainty needs the rows per city, it cannot be used with stream")
+        aggregate = 'tdigest' if aggregate is None else aggregate
+    if result_format is None:
+        result_format = get_result_format(output_path) if output_path is not None else 'csv'
+
+    with instrumentation.stage("metadata"):
+        metadata = load_metadata(metadata_file_path)
+
+    if stream:
+        with instrumentation.stage("specific energy, streamed") as stage_metrics:
+            data_weighted_average_df = calc_weighted_average_streaming(
+                metadata.cities_array, metadata.climate_region_array, metadata.floor_area_climate_df,
+                metadata.scenarios_array, workers=workers, city_results_path=city_results_path)
+            stage_metrics["rows"] = len(data_weighted_average_df)
+    else:
+        with instrumentation.stage("specific energy per city") as stage_metrics:
+            result_cache = ResultCache() if use_cache else None
+            try:
+                specific_thermal_consumption_per_city_df = inference.calc_specific_energy_per_major_city(
+                    metadata.cities_array, metadata.climate_region_array, metadata.floor_area_climate_df,
+                    metadata.scenarios_array, workers=workers, result_cache=result_cache,
+                    instrumentation=instrumentation)
+            finally:
+                if result_cache is not None:
+                    result_cache.close()
+            stage_metrics["rows"] = len(specific_thermal_consumption_per_city_df)
+
+        with instrumentation.stage("weighted average") as stage_metrics:
+            data_weighted_average_df = inference.calc_weighted_average_per_scenario(
+                specific_thermal_consumption_per_city_df)
+            stage_metrics["rows"] = len(data_weighted_average_df)
+
+    with instrumentation.stage("montecarlo and percentiles") as stage_metrics:
+        if joint_uncertainty is not None:
+            data_consumption = calc_joint_percentiles_per_scenario(
+                specific_thermal_consumption_per_city_df, metadata.cities_array, metadata.climate_region_array,
+                metadata.floor_area_predictions_df, metadata.floor_area_climate_df, metadata.scenarios_array,
+                list(ACH_PER_SECTOR.keys()), n_samples=n_samples, seed=seed, method=aggregate,
+                sources=joint_uncertainty, workers=workers)
+            if write_intermediate:
+                write_results(data_consumption, with_result_format(INTERMEDIATE_PERCENTILES_FILE_PATH, result_format),
+                              index=True)
+        elif aggregate is None:
+            data_final_df = inference.calc_total_energy_consumption_per_scenario(
+                data_weighted_average_df, metadata.floor_area_predictions_df, metadata.scenarios_array,
+                n_samples=n_samples, seed=seed)
+            if write_intermediate:
+                write_results(data_final_df, with_result_format(INTERMEDIATE_RESULT_FILE_PATH, result_format),
+                              index=False)
+            data_consumption = calc_percentiles_per_group(data_final_df)
+        else:
+            data_consumption = inference.calc_percentiles_per_scenario(
+                data_weighted_average_df, metadata.floor_area_predictions_df, metadata.scenarios_array,
+                n_samples=n_samples, seed=seed, method=aggregate)
+            if write_intermediate:
+                write_results(data_consumption, with_result_format(INTERMEDIATE_PERCENTILES_FILE_PATH, result_format),
+                              index=True)
+        stage_metrics["rows"] = len(data_consumption)
+
+    with instrumentation.stage("final result") as stage_metrics:
+        final_result_df = prediction.calc_final_result(data_consumption, metadata.scenarios_array)
+        if output_path is not None:
+            write_results(final_result_df, output_path, index=True, result_format=result_format)
+        stage_metrics["rows"] = len(final_result_df)
+
+    stage_reports = [StageReport(event["name"], event["seconds"], event.get("peak_memory_MB", float('nan')))
+                     for event in instrumentation.stage_events()]
+    return PipelineResult(final_result_df, data_consumption, stage_reports)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Step 1 and step 2 of the model in one run")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes used to compute the (city, scenario) pairs (default: 1, serial)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recalculate every (city, scenario) pair instead of reusing the results of earlier runs")
+    parser.add_argument("--samples", type=int, default=MONTECARLO_N_SAMPLES,
+                        help="montecarlo samples of the built area per scenario and sector")
+    parser.add_argument("--seed", type=int, default=MONTECARLO_SEED,
+                        help="seed of the montecarlo simulation, the same seed gives the same samples")
+    parser.add_argument("--aggregate", choices=['auto', 'none', 'exact', 'tdigest'], default='auto',
+                        help="keep every montecarlo sample (none) or only their percentiles, exact or estimated "
+                             "with a t-digest sketch in a bounded memory (default: auto, exact or tdigest with "
+                             "--joint-uncertainty)")
+    parser.add_argument("--write-intermediate", action="store_true",
+                        help="also write the intermediate result of step 1 to the results folder")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also measure the peak memory of every stage with tracemalloc, which slows the run down")
+    parser.add_argument("--format", choices=['csv', 'parquet'], default='csv',
+                        help="format of the intermediate and final results, parquet needs pyarrow (default: csv)")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="write the time of every stage and (city, scenario) pair to a JSON trace, which "
+                             "chrome://tracing and https://ui.perfetto.dev display")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="run under cProfile, print the slowest functions and save the statistics to PATH")
+    parser.add_argument("--stream", action="store_true",
+                        help="compute the (city, scenario) pairs in batches folded into the weighted average right "
+                             "away, for city sets too large for the memory. The result cache is not used")
+    parser.add_argument("--city-results", metavar="PATH",
+                        help="with --stream, also write the rows per city and scenario to this CSV file")
+    parser.add_argument("--joint-uncertainty", nargs='*', choices=UNCERTAINTY_SOURCES, metavar="SOURCE",
+                        help="sample the built area, the weights of the climate regions and the spread between the "
+                             "cities together (or only the sources listed, from {})".format(
+                            ", ".join(UNCERTAINTY_SOURCES)))
+    args = parser.parse_args()
+    if args.joint_uncertainty == []:
+        args.joint_uncertainty = UNCERTAINTY_SOURCES
+
+    instrumentation = Instrumentation(measure_memory=args.trace_memory)
+    with profiled(args.profile) if args.profile else nullcontext():
+        pipeline_result = run_pipeline(workers=args.workers, use_cache=not args.no_cache, n_samples=args.samples,
+                                       seed=args.seed, aggregate=None if args.aggregate == 'none' else args.aggregate,
+                                       write_intermediate=args.write_intermediate,
+                                       output_path=with_result_format(FINAL_RESULT_FILE_PATH, args.format),
+                                       instrumentation=instrumentation, stream=args.stream,
+                                       city_results_path=args.city_results,
+                                       joint_uncertainty=args.joint_uncertainty)
+    instrumentation.print_summary()
+    if args.trace:
+        instrumentation.write_trace(args.trace)
@@ -0,0 +1,193 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model.auxiliary import read_weather_data_scenario
+from model.constants import ACH_PER_SECTOR, HOURS_OF_THE_YEAR, MONTECARLO_N_SAMPLES, MONTECARLO_SEED, PERCENTILES
+from model.enthalpy import calc_hourly_specific_thermal_consumption, calc_total_heating_cooling
+from model.metadata import load_metadata
+from model.montecarlo import get_floor_area_distribution, iter_normal_samples
+from model.percentiles import PercentileAccumulator
+from model.result_io import write_results
+from model.weights import calc_city_weight_matrix, get_region_weights
+from pointers import NATIONAL_PROFILES_FILE_PATH
+
+# hours per time step of every resolution
+RESOLUTIONS = {"hour": 1, "day": 24}
+
+
+def calc_city_profiles(T_outdoor_C, RH_outdoor_perc, resolution="day"):
+    """
+    Specific energy consumption [kWh/m2] of a city per time step, array of shape (n_sectors, 2, n_steps) with
+    [heating, cooling]. The sum over the time steps is the annual value of calc_specific_energy_weather.
+    """
+    specific_thermal_consumption_kWhm2 = calc_hourly_specific_thermal_consumption(
+        T_outdoor_C[np.newaxis, :], RH_outdoor_perc[np.newaxis, :], ACH=list(ACH_PER_SECTOR.values()))[0]
+    profiles_kWhm2 = calc_total_heating_cooling(specific_thermal_consumption_kWhm2, axis=1)
+    n_sectors, n_uses, n_hours = profiles_kWhm2.shape
+    return profiles_kWhm2.reshape(n_sectors, n_uses, n_hours // RESOLUTIONS[resolution], -1).sum(axis=-1)
+
+
+def calc_scenario_profiles(profiles_path, scenario_index, scenario, cities_array, city_weight_matrix, resolution="day",
+                           use_weather_cache=True):
+    # weighted sum of the profiles of every city, written to the slot of the scenario in the shared array on disk
+    national_profiles_kWhm2 = 0.0
+    for city, city_weights in zip(cities_array, city_weight_matrix.T):
+        T_outdoor_C, RH_outdoor_perc = read_weather_data_scenario(city, scenario, use_cache=use_weather_cache)
+        national_profiles_kWhm2 = national_profiles_kWhm2 + city_weights[:, np.newaxis, np.newaxis] * \
+            calc_city_profiles(T_outdoor_C, RH_outdoor_perc, resolution)
+    profiles = np.load(profiles_path, mmap_mode='r+')
+    profiles[scenario_index] = national_profiles_kWhm2
+    profiles.flush()
+
+
+def calc_national_profiles(cities_array, climate_region_array, floor_area_climate_df, scenarios_array,
+                           resolution="day", workers=1, profiles_path=NATIONAL_PROFILES_FILE_PATH,
+                           use_weather_cache=True):
+    """
+    National heating and cooling profiles [kWh/m2 per time step] per scenario and sector, with the weights of
+    calc_weighted_average_per_scenario: the sum over the time steps is the weighted average of step 1.
+
+    The profiles are a .npy file on disk opened as a memory map. Every scenario is computed by one worker, which
+    writes its slot of the file directly, so nothing larger than the weights is sent between processes, and only
+    the profiles of one scenario are in the memory of a worker.
+
+    :param resolution: "hour" or "day"
+    :return: read-only memory map of shape (n_scenarios, n_sectors, 2, n_steps), [heating, cooling]
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError("valid resolutions are {}".format(list(RESOLUTIONS.keys())))
+    sectors = list(ACH_PER_SECTOR.keys())
+    city_weight_matrix = calc_city_weight_matrix(climate_region_array,
+                                                 get_region_weights(floor_area_climate_df, sectors))
+
+    # the shared array, one slot per scenario
+    shape = (len(scenarios_array), len(sectors), 2, HOURS_OF_THE_YEAR // RESOLUTIONS[resolution])
+    os.makedirs(os.path.dirname(os.path.abspath(profiles_path)), exist_ok=True)
+    profiles = np.lib.format.open_memmap(profiles_path, mode='w+', dtype=np.float64, shape=shape)
+    del profiles
+
+    arguments = ([profiles_path] * len(scenarios_array), range(len(scenarios_array)), scenarios_array,
+                 [cities_array] * len(scenarios_array), [city_weight_matrix] * len(scenarios_array),
+                 [resolution] * len(scenarios_array), [use_weather_cache] * len(scenarios_array))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(calc_scenario_profiles, *arguments))
+    else:
+        list(map(calc_scenario_profiles, *arguments))
+    return np.load(profiles_path, mmap_mode='r')
+
+
+def calc_load_profile_percentiles(profiles_kWhm2, floor_area_predictions_df, scenarios_array,
+                                  n_samples=MONTECARLO_N_SAMPLES, seed=MONTECARLO_SEED, percentiles=PERCENTILES,
+                                  output_path=None, method='exact'):
+    """
+    Percentiles of the national load [GWh per time step] over the montecarlo samples of the built area, same
+    samples as calc_percentiles_per_scenario.
+
+    The load is the built area times a profile that is not negative, so its percentiles are the percentiles of the
+    built area times the profile: no sample is held per time step, whatever the number of samples.
+
+    :param profiles_kWhm2: array of shape (n_scenarios, n_sectors, 2, n_steps), see calc_national_profiles
+    :param output_path: .npy file for the result, opened as a memory map, instead of an array in memory
+    :param method: 'exact' keeps every sample of the built area, 'tdigest' estimates its percentiles in a memory that
+        does not grow with n_samples, see PercentileAccumulator
+    :return: array of shape (n_scenarios, n_sectors, 2, n_steps, len(percentiles))
+    """
+    sectors = list(ACH_PER_SECTOR.keys())
+    years = [scenario.split("_")[-1] for scenario in scenarios_array]
+    mean_m2, std_m2 = get_floor_area_distribution(floor_area_predictions_df, years, sectors)
+    accumulator = PercentileAccumulator(mean_m2.shape, method)
+    for GFA_m2 in iter_normal_samples(mean_m2, std_m2, n_samples, seed):
+        accumulator.update(GFA_m2)
+    GFA_m2 = accumulator.percentile(percentiles)
+
+    shape = tuple(np.shape(profiles_kWhm2)) + (len(percentiles),)
+    if output_path is None:
+        load_GWh = np.empty(shape)
+    else:
+        load_GWh = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float64, shape=shape)
+    for i in range(len(scenarios_array)):
+        load_GWh[i] = np.asarray(profiles_kWhm2[i])[..., np.newaxis] * GFA_m2[i, :, np.newaxis, np.newaxis, :] / 1E6
+    return load_GWh
+
+
+def build_profiles_df(profiles_kWhm2, scenarios_array, resolution="day"):
+    # tidy table, one row per scenario, sector and time step
+    sectors = list(ACH_PER_SECTOR.keys())
+    n_scenarios, n_sectors, _, n_steps = np.shape(profiles_kWhm2)
+    profiles_kWhm2 = np.asarray(profiles_kWhm2)
+    return pd.DataFrame({"SCENARIO": np.repeat(scenarios_array, n_sectors * n_steps),
+                         "BUILDING_CLASS": np.tile(np.repeat(sectors, n_steps), n_scenarios),
+                         resolution.upper(): np.tile(np.arange(n_steps), n_scenarios * n_sectors),
+                         "TOTAL_HEATING_kWh_m2": profiles_kWhm2[:, :, 0].ravel(),
+                         "TOTAL_COOLING_kWh_m2": profiles_kWhm2[:, :, 1].ravel()})
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="National heating and cooling profiles per scenario and sector")
+    parser.add_argument("--resolution", choices=list(RESOLUTIONS.keys()), default="day",
+                        help="time step of the profiles (default: day)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes computing the scenarios (default: 1, serial)")
+    parser.add_argument("--output", help="profiles [kWh/m2 per time step] as a .npy file of shape (scenario, sector, "
+                                         "heating|cooling, time step) (default: results/national_profiles_"
+                                         "<resolution>.npy)")
+    parser.add_argument("--table", metavar="PATH",
+                        help="also write the profiles as a table, .csv or .parquet")
+    parser.add_argument("--load-percentiles", metavar="PATH",
+                        help="also write the percentiles of the load [GWh per time step] over the montecarlo "
+                             "samples of the built area to this .npy file")
+    parser.add_argument("--samples", type=int, default=MONTECARLO_N_SAMPLES,
+                        help="montecarlo samples of the built area per scenario and sector")
+    parser.add_argument("--seed", type=int, default=MONTECARLO_SEED,
+                        help="seed of the montecarlo simulation, the same seed gives the same samples")
+    parser.add_argument("--aggregate", choices=['exact', 'tdigest'], default='exact',
+                        help="percentiles of the built area for --load-percentiles, exact or estimated with a "
+                             "t-digest sketch in a bounded memory, for very large sample counts (default: exact)")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    output_path = args.output
+    if output_path is None:
+        output_path = "{}_{}.npy".format(os.path.splitext(NATIONAL_PROFILES_FILE_PATH)[0], args.resolution)
+    metadata = load_metadata()
+    profiles_kWhm2 = calc_national_profiles(metadata.cities_array, metadata.climate_region_array,
+                                            metadata.floor_area_climate_df, metadata.scenarios_array,
+                                            resolution=args.resolution, workers=args.workers,
+                                            profiles_path=output_path)
+    if args.table:
+        write_results(build_profiles_df(profiles_kWhm2, metadata.scenarios_array, args.resolution), args.table)
+    if args.load_percentiles:
+        calc_load_profile_percentiles(profiles_kWhm2, metadata.floor_area_predictions_df, metadata.scenarios_array,
+                                      n_samples=args.samples, seed=args.seed, output_path=args.load_percentiles,
+                                      method=args.aggregate)
+    t1 = round((time.time() - t0) / 60, 2)
+    print("finished after {} minutes".format(t1))
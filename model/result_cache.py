@@ -0,0 +1,115 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from model.constants import RESULT_CACHE_MAX_ENTRIES
+from pointers import RESULT_CACHE_FILE_PATH
+
+# change when the calculation of the energy intensities changes, so older entries are not reused
+RESULT_CACHE_VERSION = 1
+
+
+def calc_result_cache_key(weather_file_hash, constants):
+    """
+    Content address of an energy intensity: the hash of the weather file and of every constant that enters
+    the calculation (COP, base temperature and relative humidity, ACH).
+    """
+    content = json.dumps({"version": RESULT_CACHE_VERSION,
+                          "weather": weather_file_hash,
+                          "constants": constants}, sort_keys=True)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+class ResultCache(object):
+    """
+    Persistent cache of energy intensities [kWh/m2 yr] per content address, stored in a SQLite database.
+    Once it holds more than max_entries the least recently used entries are evicted.
+    """
+
+    def __init__(self, path=RESULT_CACHE_FILE_PATH, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results ("
+                                "key TEXT PRIMARY KEY, "
+                                "total_heating_kWh_m2_yr REAL NOT NULL, "
+                                "total_cooling_kWh_m2_yr REAL NOT NULL, "
+                                "last_access REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)")
+        self.connection.commit()
+
+    def get(self, keys):
+        """
+        :return: dictionary key -> (total heating, total cooling) of the keys found in the cache
+        """
+        found = {}
+        keys = list(set(keys))
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            rows = self.connection.execute("SELECT key, total_heating_kWh_m2_yr, total_cooling_kWh_m2_yr "
+                                           "FROM results WHERE key IN ({})".format(",".join("?" * len(batch))),
+                                           batch).fetchall()
+            found.update({key: (heating, cooling) for key, heating, cooling in rows})
+
+        # mark the entries as recently used
+        now = time.time()
+        self.connection.executemany("UPDATE results SET last_access = ? WHERE key = ?",
+                                    [(now, key) for key in found])
+        self.connection.commit()
+        return found
+
+    def put(self, items):
+        """
+        :param items: dictionary key -> (total heating, total cooling)
+        """
+        now = time.time()
+        self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                    [(key, float(heating), float(cooling), now)
+                                     for key, (heating, cooling) in items.items()])
+        self.evict()
+        self.connection.commit()
+
+    def evict(self):
+        n_entries = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if n_entries > self.max_entries:
+            self.connection.execute("DELETE FROM results WHERE key IN "
+                                    "(SELECT key FROM results ORDER BY last_access, rowid LIMIT ?)",
+                                    (n_entries - self.max_entries,))
+
+    def clear(self):
+        self.connection.execute("DELETE FROM results")
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
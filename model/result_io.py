@@ -0,0 +1,108 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+RESULT_FORMATS = {'.csv': 'csv', '.parquet': 'parquet', '.pq': 'parquet'}
+
+# repeated labels stored as dictionary-encoded categoricals in parquet
+CATEGORICAL_COLUMNS = ["CITY", "CLIMATE", "SCENARIO", "YEAR", "BUILDING_CLASS",
+                       "Model", "Scenario", "Region", "Variable", "Unit"]
+
+# separator of the levels of multi-level column names, which parquet does not store
+COLUMN_LEVEL_SEPARATOR = "|"
+
+
+def get_result_format(file_location):
+    extension = os.path.splitext(file_location)[1].lower()
+    if extension not in RESULT_FORMATS:
+        raise ValueError("valid extensions are {}".format(list(RESULT_FORMATS.keys())))
+    return RESULT_FORMATS[extension]
+
+
+def with_result_format(file_location, result_format):
+    """
+    Same file location with the extension of result_format ('csv' or 'parquet')
+    """
+    if result_format not in RESULT_FORMATS.values():
+        raise ValueError("valid formats are {}".format(sorted(set(RESULT_FORMATS.values()))))
+    return os.path.splitext(file_location)[0] + "." + result_format
+
+
+def write_results(data_df, file_location, index=False, result_format=None, float32=True):
+    """
+    Writes a table of results as CSV or parquet, chosen from the extension of the file unless result_format is given.
+
+    In parquet, the columns in CATEGORICAL_COLUMNS are dictionary encoded and the float columns are stored as
+    float32 (unless float32=False). The index is stored as columns when index=True.
+    """
+    result_format = get_result_format(file_location) if result_format is None else result_format
+    if result_format == 'csv':
+        data_df.to_csv(file_location, index=index)
+        return
+
+    check_parquet_support()
+    if index:
+        data_df = data_df.reset_index()
+    if isinstance(data_df.columns, pd.MultiIndex):
+        data_df = data_df.copy()
+        data_df.columns = [COLUMN_LEVEL_SEPARATOR.join(str(level) for level in column if level != "")
+                           for column in data_df.columns]
+    else:
+        data_df = data_df.rename(columns=str)
+    columns = {}
+    for column in data_df.columns:
+        values = data_df[column]
+        if column in CATEGORICAL_COLUMNS:
+            values = values.astype('category')
+        elif float32 and values.dtype == np.float64:
+            values = values.astype(np.float32)
+        columns[column] = values
+    pd.DataFrame(columns).to_parquet(file_location, index=False)
+
+
+def read_results(file_location, result_format=None):
+    """
+    Reads a table written by write_results. Categorical columns are returned with the type of their labels.
+    """
+    result_format = get_result_format(file_location) if result_format is None else result_format
+    if result_format == 'csv':
+        return pd.read_csv(file_location)
+
+    check_parquet_support()
+    data_df = pd.read_parquet(file_location)
+    for column in data_df.columns:
+        if isinstance(data_df[column].dtype, pd.CategoricalDtype):
+            data_df[column] = data_df[column].astype(data_df[column].cat.categories.dtype)
+    return data_df
+
+
+def check_parquet_support():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError("the parquet format needs pyarrow, install it with pip install pyarrow "
+                          "or pip install DEG-USA[parquet]")
@@ -0,0 +1,208 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import argparse
+import itertools
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model.auxiliary import iter_submitted, read_weather_data_scenario
+from model.constants import ACH_PER_SECTOR
+from model.enthalpy import calc_specific_thermal_consumption_batch, calc_total_heating_cooling
+from model.metadata import load_metadata
+from model.result_io import write_results
+from model.weights import get_region_weights
+
+CITY_RESULT_COLUMNS = ["CITY", "CLIMATE", "WEIGHT", "SCENARIO", "YEAR", "BUILDING_CLASS", "TOTAL_HEATING_kWh_m2_yr",
+                       "TOTAL_COOLING_kWh_m2_yr"]
+
+
+class WeightedAverageAccumulator(object):
+    """
+    Running sums of the energy intensities per scenario, climate region and sector. Once every city is added, it
+    gives the same table as calc_weighted_average_per_scenario, with a memory that does not depend on the number of
+    cities.
+    """
+
+    def __init__(self, scenarios_array, floor_area_climate_df, sectors):
+        self.scenarios_array = np.asarray(scenarios_array)
+        self.sectors = list(sectors)
+        self.climate_regions = sorted(floor_area_climate_df.index)
+        self.scenario_index = {scenario: i for i, scenario in enumerate(self.scenarios_array)}
+        self.climate_index = {climate: i for i, climate in enumerate(self.climate_regions)}
+
+        # weight of every climate region and sector, shape (n_regions, n_sectors)
+        self.weights = get_region_weights(floor_area_climate_df, self.sectors).loc[self.climate_regions].values
+
+        # sum of [heating, cooling] and number of cities per scenario and climate region
+        self.sums = np.zeros((len(self.scenarios_array), len(self.climate_regions), len(self.sectors), 2))
+        self.counts = np.zeros((len(self.scenarios_array), len(self.climate_regions)), dtype=np.int64)
+
+    def update(self, climates, scenarios, specific_thermal_consumption_kWhm2yr):
+        """
+        :param climates: climate region of every (city, scenario) pair of the batch
+        :param scenarios: scenario of every pair of the batch
+        :param specific_thermal_consumption_kWhm2yr: array of shape (n_pairs, n_sectors, 2), [heating, cooling]
+        """
+        scenario_index = np.array([self.scenario_index[scenario] for scenario in scenarios], dtype=np.int64)
+        climate_index = np.array([self.climate_index[climate] for climate in climates], dtype=np.int64)
+        np.add.at(self.sums, (scenario_index, climate_index), specific_thermal_consumption_kWhm2yr)
+        np.add.at(self.counts, (scenario_index, climate_index), 1)
+
+    def weighted_average_df(self):
+        # mean per climate region times its weight, summed over the regions with at least one city
+        present = self.counts > 0
+        mean = self.sums / np.where(present, self.counts, 1)[..., np.newaxis, np.newaxis]
+        weights = np.where(present[..., np.newaxis], self.weights, 0.0)
+        weighted_sum = (mean * weights[..., np.newaxis]).sum(axis=1)
+
+        n_scenarios, n_sectors = len(self.scenarios_array), len(self.sectors)
+        data_weighted_average = pd.DataFrame({
+            "YEAR": np.repeat([scenario.split("_")[-1] for scenario in self.scenarios_array], n_sectors),
+            "BUILDING_CLASS": np.tile(self.sectors, n_scenarios),
+            "SCENARIO": np.repeat(self.scenarios_array, n_sectors),
+            "WEIGHT": weights.sum(axis=1).ravel(),
+            "TOTAL_HEATING_kWh_m2_yr": weighted_sum[..., 0].ravel(),
+            "TOTAL_COOLING_kWh_m2_yr": weighted_sum[..., 1].ravel()})
+
+        # same order as the groupby of calc_weighted_average_per_scenario
+        data_weighted_average = data_weighted_average[present.any(axis=1).repeat(n_sectors)]
+        return data_weighted_average.sort_values(["YEAR", "BUILDING_CLASS", "SCENARIO"]).reset_index(drop=True)
+
+
+def iter_pair_batches(cities_array, climate_region_array, scenarios_array, batch_size=256):
+    # (city, climate, scenario) pairs in the order of calc_specific_energy_per_major_city, batch_size at a time
+    pairs = ((city, climate, scenario) for city, climate in zip(cities_array, climate_region_array)
+             for scenario in scenarios_array)
+    while True:
+        batch = list(itertools.islice(pairs, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def calc_specific_energy_batch(batch, use_weather_cache=True):
+    """
+    Specific energy consumption of a batch of (city, climate, scenario) pairs, array of shape
+    (n_pairs, n_sectors, 2) with [heating, cooling] per sector. Only the hourly data of the batch is in memory.
+    """
+    T_outdoor_C, RH_outdoor_perc = zip(*[read_weather_data_scenario(city, scenario, use_cache=use_weather_cache)
+                                         for city, climate, scenario in batch])
+    specific_thermal_consumption_kWhm2yr = calc_specific_thermal_consumption_batch(
+        np.stack(T_outdoor_C), np.stack(RH_outdoor_perc), ACH=list(ACH_PER_SECTOR.values()))
+    return calc_total_heating_cooling(specific_thermal_consumption_kWhm2yr)
+
+
+def calc_weighted_average_streaming(cities_array, climate_region_array, floor_area_climate_df, scenarios_array,
+                                    batch_size=256, workers=1, city_results_path=None, use_weather_cache=True):
+    """
+    Streaming version of calc_specific_energy_per_major_city followed by calc_weighted_average_per_scenario, for
+    city sets too large to keep every row in memory. The (city, scenario) pairs are computed in batches, and every
+    batch is folded into the sums per climate region right away.
+
+    :param batch_size: (city, scenario) pairs whose hourly weather data is held in memory at once, per worker
+    :param workers: number of processes computing the batches
+    :param city_results_path: if given, the rows per city are appended to this CSV file as they are computed
+    :param use_weather_cache: read the weather data from the binary cache, writing it when missing. Without it
+        every weather file is parsed, which avoids a copy of the weather data on disk
+    :return: same dataframe as calc_weighted_average_per_scenario
+    """
+    sectors = list(ACH_PER_SECTOR.keys())
+    accumulator = WeightedAverageAccumulator(scenarios_array, floor_area_climate_df, sectors)
+    batches = iter_pair_batches(cities_array, climate_region_array, scenarios_array, batch_size)
+    if workers > 1:
+        # the peak memory is only measured in this process, a forked worker does not trace its allocations
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=tracemalloc.stop)
+        computed = ((batch, specific_thermal_consumption_kWhm2yr)
+                    for (batch, _), specific_thermal_consumption_kWhm2yr in iter_submitted(
+                        executor, calc_specific_energy_batch, ((batch, use_weather_cache) for batch in batches),
+                        max_pending=2 * workers))
+    else:
+        executor = None
+        computed = ((batch, calc_specific_energy_batch(batch, use_weather_cache)) for batch in batches)
+
+    header = True
+    try:
+        for batch, specific_thermal_consumption_kWhm2yr in computed:
+            cities, climates, scenarios = zip(*batch)
+            accumulator.update(climates, scenarios, specific_thermal_consumption_kWhm2yr)
+            if city_results_path is not None:
+                write_city_results(city_results_path, batch, specific_thermal_consumption_kWhm2yr, sectors,
+                                   floor_area_climate_df, header)
+                header = False
+    finally:
+        # on an error, the calls not started yet are cancelled instead of run by the shutdown
+        computed.close()
+        if executor is not None:
+            executor.shutdown()
+    return accumulator.weighted_average_df()
+
+
+def write_city_results(city_results_path, batch, specific_thermal_consumption_kWhm2yr, sectors,
+                       floor_area_climate_df, header=True):
+    # same rows as calc_specific_energy_per_major_city, one per pair and sector
+    n_pairs, n_sectors = len(batch), len(sectors)
+    cities, climates, scenarios = (np.array(column, dtype=object) for column in zip(*batch))
+    weights = np.array([[floor_area_climate_df.loc[climate, 'GFA_mean_' + sector + '_perc'] for sector in sectors]
+                        for climate in climates])
+    city_results_df = pd.DataFrame({"CITY": np.repeat(cities, n_sectors),
+                                    "CLIMATE": np.repeat(climates, n_sectors),
+                                    "WEIGHT": weights.ravel(),
+                                    "SCENARIO": np.repeat(scenarios, n_sectors),
+                                    "YEAR": np.repeat([scenario.split("_")[-1] for scenario in scenarios], n_sectors),
+                                    "BUILDING_CLASS": np.tile(sectors, n_pairs),
+                                    "TOTAL_HEATING_kWh_m2_yr": specific_thermal_consumption_kWhm2yr[..., 0].ravel(),
+                                    "TOTAL_COOLING_kWh_m2_yr": specific_thermal_consumption_kWhm2yr[..., 1].ravel()},
+                                   columns=CITY_RESULT_COLUMNS)
+    city_results_df.to_csv(city_results_path, mode='w' if header else 'a', header=header, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Weighted average of the specific energy consumption per scenario, "
+                                                 "streamed in batches of (city, scenario) pairs")
+    parser.add_argument("--output", required=True, help="CSV or parquet file of the weighted averages")
+    parser.add_argument("--batch-size", type=int, default=256,
+                        help="(city, scenario) pairs held in memory at once, per worker (default: 256)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of processes computing the batches (default: 1, serial)")
+    parser.add_argument("--city-results", metavar="PATH",
+                        help="also write the rows per city and scenario to this CSV file")
+    parser.add_argument("--no-weather-cache", action="store_true",
+                        help="parse every weather file instead of reading and writing the binary weather cache")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    metadata = load_metadata()
+    data_weighted_average_df = calc_weighted_average_streaming(metadata.cities_array, metadata.climate_region_array,
+                                                               metadata.floor_area_climate_df,
+                                                               metadata.scenarios_array, batch_size=args.batch_size,
+                                                               workers=args.workers,
+                                                               city_results_path=args.city_results,
+                                                               use_weather_cache=not args.no_weather_cache)
+    write_results(data_weighted_average_df, args.output, index=False)
+    t1 = round((time.time() - t0) / 60, 2)
+    print("finished after {} minutes".format(t1))
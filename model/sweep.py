@@ -0,0 +1,188 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import argparse
+import itertools
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from model import constants
+from model.auxiliary import read_weather_data_scenario
+from model.enthalpy import calc_daily_cooling_gradients, calc_daily_heating_gradients, calc_consumption_factor
+from model.metadata import load_metadata
+from model.result_io import write_results
+from model.weights import calc_city_weight_matrix, calc_national_intensity, get_region_weights
+
+# constants of model/constants.py that can be varied in a sweep
+SWEEP_PARAMETERS = ["COP_cooling", "COP_heating", "T_base_cooling_C", "RH_base_cooling_perc", "T_base_heating_C",
+                    "RH_base_heating_perc", "ACH_Residential", "ACH_Commercial"]
+SECTORS = list(constants.ACH_PER_SECTOR.keys())
+
+
+def make_parameter_grid(**values):
+    """
+    Every combination of the values given per parameter, e.g., make_parameter_grid(COP_cooling=[3.0, 3.3, 3.6],
+    ACH_Residential=[3.0, 4.0]) gives 6 parameter sets. The other parameters keep their value in model/constants.py.
+    """
+    check_parameters(values)
+    names = list(values.keys())
+    return [dict(zip(names, combination)) for combination in itertools.product(*[values[name] for name in names])]
+
+
+def check_parameters(parameter_set):
+    unknown = set(parameter_set) - set(SWEEP_PARAMETERS)
+    if unknown:
+        raise ValueError("unknown parameters {}, valid parameters are {}".format(sorted(unknown), SWEEP_PARAMETERS))
+
+
+def complete_parameter_set(parameter_set):
+    check_parameters(parameter_set)
+    return {name: float(parameter_set.get(name, getattr(constants, name))) for name in SWEEP_PARAMETERS}
+
+
+def run_sweep(parameter_sets, metadata=None, national=False, batch_size=256):
+    """
+    Specific energy consumption for many sets of constants in one run.
+
+    The weather files are read once. The daily enthalpy gradients are computed once per distinct base condition
+    (T_base_*, RH_base_*) of the grid, and COP and ACH, which only scale the gradients, are applied as a broadcast
+    over all the parameter sets.
+
+    :param parameter_sets: list of dictionaries parameter -> value, see make_parameter_grid
+    :param metadata: model.metadata.Metadata, loaded from metadata.xlsx when not given
+    :param national: return the weighted average per scenario instead of the value per city
+    :param batch_size: (city, scenario) pairs whose hourly weather data is held in memory at once
+    :return: tidy dataframe with one row per parameter set, (city,) scenario and building class, keyed by
+        PARAMETER_SET and holding the values of the parameters
+    """
+    metadata = load_metadata() if metadata is None else metadata
+    parameter_sets = [complete_parameter_set(parameter_set) for parameter_set in parameter_sets]
+    parameters = pd.DataFrame(parameter_sets, columns=SWEEP_PARAMETERS)
+
+    # distinct base conditions of the grid and the one of every parameter set
+    cooling_bases, cooling_base_index = np.unique(parameters[["T_base_cooling_C", "RH_base_cooling_perc"]].values,
+                                                  axis=0, return_inverse=True)
+    heating_bases, heating_base_index = np.unique(parameters[["T_base_heating_C", "RH_base_heating_perc"]].values,
+                                                  axis=0, return_inverse=True)
+
+    # daily enthalpy gradients per base condition and (city, scenario) pair
+    pairs = [(city, climate, scenario) for city, climate in zip(metadata.cities_array, metadata.climate_region_array)
+             for scenario in metadata.scenarios_array]
+    cooling_gradients = np.empty((len(cooling_bases), len(pairs), 2))
+    heating_gradients = np.empty((len(heating_bases), len(pairs), 2))
+    for start in range(0, len(pairs), batch_size):
+        batch = slice(start, start + batch_size)
+        T_outdoor_C, RH_outdoor_perc = zip(*[read_weather_data_scenario(city, scenario)
+                                             for city, climate, scenario in pairs[batch]])
+        T_outdoor_C, RH_outdoor_perc = np.stack(T_outdoor_C), np.stack(RH_outdoor_perc)
+        for i, (T_base_C, RH_base_perc) in enumerate(cooling_bases):
+            cooling_gradients[i, batch] = calc_daily_cooling_gradients(T_outdoor_C, RH_outdoor_perc, T_base_C,
+                                                                       RH_base_perc)
+        for i, (T_base_C, RH_base_perc) in enumerate(heating_bases):
+            heating_gradients[i, batch] = calc_daily_heating_gradients(T_outdoor_C, RH_outdoor_perc, T_base_C,
+                                                                       RH_base_perc)
+
+    # COP and ACH as a broadcast, arrays of shape (n_parameter_sets, n_pairs, n_sectors)
+    ACH = parameters[["ACH_" + sector for sector in SECTORS]].values[:, np.newaxis, :]
+    cooling_factor = calc_consumption_factor(ACH, parameters["COP_cooling"].values[:, np.newaxis, np.newaxis])
+    heating_factor = calc_consumption_factor(ACH, parameters["COP_heating"].values[:, np.newaxis, np.newaxis])
+    total_cooling_kWhm2yr = cooling_gradients[cooling_base_index].sum(axis=-1)[..., np.newaxis] * cooling_factor
+    total_heating_kWhm2yr = heating_gradients[heating_base_index].sum(axis=-1)[..., np.newaxis] * heating_factor
+
+    n_sets = len(parameter_sets)
+    if national:
+        data_sweep_df = calc_national_sweep(total_heating_kWhm2yr, total_cooling_kWhm2yr, metadata)
+    else:
+        data_sweep_df = build_city_sweep_df(total_heating_kWhm2yr, total_cooling_kWhm2yr, pairs, metadata)
+
+    # add the values of the parameters
+    parameters.insert(0, "PARAMETER_SET", np.arange(n_sets))
+    return parameters.merge(data_sweep_df, on="PARAMETER_SET")
+
+
+def calc_national_sweep(total_heating_kWhm2yr, total_cooling_kWhm2yr, metadata):
+    """
+    Weighted average per parameter set, scenario and building class, as one matrix product over the cities.
+
+    :param total_heating_kWhm2yr: array of shape (n_parameter_sets, n_pairs, n_sectors), pairs ordered by city
+        and then by scenario
+    """
+    n_sets, n_cities, n_scenarios = len(total_heating_kWhm2yr), len(metadata.cities_array), \
+        len(metadata.scenarios_array)
+    city_weight_matrix = calc_city_weight_matrix(metadata.climate_region_array,
+                                                 get_region_weights(metadata.floor_area_climate_df, SECTORS))
+
+    # arrays of shape (n_parameter_sets, n_scenarios, n_sectors, n_cities) reduced over the cities
+    national = {}
+    for column, values in [("TOTAL_HEATING_kWh_m2_yr", total_heating_kWhm2yr),
+                           ("TOTAL_COOLING_kWh_m2_yr", total_cooling_kWhm2yr)]:
+        city_values = values.reshape(n_sets, n_cities, n_scenarios, len(SECTORS)).transpose(0, 2, 3, 1)
+        national[column] = calc_national_intensity(city_values, city_weight_matrix).ravel()
+
+    scenarios = metadata.scenarios_array
+    data_national_df = pd.DataFrame(dict({
+        "PARAMETER_SET": np.repeat(np.arange(n_sets), n_scenarios * len(SECTORS)),
+        "SCENARIO": np.tile(np.repeat(scenarios, len(SECTORS)), n_sets),
+        "YEAR": np.tile(np.repeat([scenario.split("_")[-1] for scenario in scenarios], len(SECTORS)), n_sets),
+        "BUILDING_CLASS": np.tile(SECTORS, n_sets * n_scenarios)}, **national))
+    return data_national_df.sort_values(["PARAMETER_SET", "YEAR", "BUILDING_CLASS", "SCENARIO"]).reset_index(drop=True)
+
+
+def build_city_sweep_df(total_heating_kWhm2yr, total_cooling_kWhm2yr, pairs, metadata):
+    # tidy table, one row per parameter set, pair and sector
+    n_sets, n_pairs, n_sectors = total_heating_kWhm2yr.shape
+    cities, climates, scenarios = (np.array(column, dtype=object) for column in zip(*pairs))
+    weights = np.array([[metadata.floor_area_climate_df.loc[climate, 'GFA_mean_' + sector + '_perc']
+                         for sector in SECTORS] for climate in climates])
+    data_sweep_df = pd.DataFrame({"PARAMETER_SET": np.repeat(np.arange(n_sets), n_pairs * n_sectors),
+                                  "CITY": np.tile(np.repeat(cities, n_sectors), n_sets),
+                                  "CLIMATE": np.tile(np.repeat(climates, n_sectors), n_sets),
+                                  "WEIGHT": np.tile(weights.ravel(), n_sets),
+                                  "SCENARIO": np.tile(np.repeat(scenarios, n_sectors), n_sets),
+                                  "YEAR": np.tile(np.repeat([scenario.split("_")[-1] for scenario in scenarios],
+                                                            n_sectors), n_sets),
+                                  "BUILDING_CLASS": np.tile(SECTORS, n_sets * n_pairs),
+                                  "TOTAL_HEATING_kWh_m2_yr": total_heating_kWhm2yr.ravel(),
+                                  "TOTAL_COOLING_kWh_m2_yr": total_cooling_kWhm2yr.ravel()})
+    return data_sweep_df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Specific energy consumption for a grid of constants")
+    parser.add_argument("grid", help="JSON file with a list of values per parameter, e.g., "
+                                     "{\"COP_cooling\": [3.0, 3.3], \"ACH_Residential\": [3.0, 4.0]}")
+    parser.add_argument("--output", required=True, help="table of results, .csv or .parquet")
+    parser.add_argument("--national", action="store_true",
+                        help="weighted average per scenario instead of the value per city")
+    args = parser.parse_args()
+
+    t0 = time.time()
+    with open(args.grid, 'r') as f:
+        grid = json.load(f)
+    data_sweep_df = run_sweep(make_parameter_grid(**grid), national=args.national)
+    write_results(data_sweep_df, args.output, index=False)
+    t1 = round((time.time() - t0) / 60, 2)
+    print("finished after {} minutes".format(t1))
@@ -0,0 +1,204 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model.auxiliary import iter_submitted
+from model.constants import MONTECARLO_N_SAMPLES, MONTECARLO_SEED, MONTECARLO_JOINT_CHUNK_SIZE, \
+    MONTECARLO_WEIGHT_CONCENTRATION
+from model.montecarlo import get_floor_area_distribution
+from model.percentiles import PercentileAccumulator, VALUE_COLUMNS, build_percentiles_df
+from model.weights import get_region_weights
+
+# sources of uncertainty of the joint montecarlo simulation
+UNCERTAINTY_SOURCES = ["floor_area", "weights", "cities"]
+
+# model of a worker process, sent once when the process starts instead of with every block of samples
+worker_model = None
+
+
+class JointUncertaintyModel(object):
+    """
+    Joint montecarlo simulation of the energy consumption per scenario and sector. Every sample draws together:
+
+    - floor_area: the gross floor area, normal with the mean and standard deviation of the FLOOR_AREA sheet,
+    - weights: the weights of the climate regions per sector, dirichlet around the shares of FLOOR_AREA_CLIMATE with
+      the given concentration (the larger, the narrower),
+    - cities: the contribution of every city to the mean of its climate region, as a bayesian bootstrap (dirichlet
+      weights of the cities of the region), for the spread of the energy intensities between cities.
+
+    The sources not in `sources` keep their value of the deterministic model, e.g., sources=["floor_area"] gives the
+    distribution of calc_percentiles_per_scenario.
+    """
+
+    def __init__(self, city_intensity, climate_region_array, floor_area_climate_df, gfa_mean_m2, gfa_std_m2, sectors,
+                 sources=UNCERTAINTY_SOURCES, concentration=MONTECARLO_WEIGHT_CONCENTRATION):
+        """
+        :param city_intensity: array of shape (n_scenarios, n_sectors, n_cities, 2), heating and cooling [kWh/m2 yr]
+        :param climate_region_array: climate region of every city
+        :param gfa_mean_m2: array of shape (n_scenarios, n_sectors), see get_floor_area_distribution
+        """
+        unknown = set(sources) - set(UNCERTAINTY_SOURCES)
+        if unknown:
+            raise ValueError("unknown sources of uncertainty {}, valid sources are {}".format(sorted(unknown),
+                                                                                             UNCERTAINTY_SOURCES))
+        self.city_intensity = np.asarray(city_intensity, dtype=np.float64)
+        self.gfa_mean_m2 = np.asarray(gfa_mean_m2, dtype=np.float64)
+        self.gfa_std_m2 = np.asarray(gfa_std_m2, dtype=np.float64)
+        self.sources = list(sources)
+        self.concentration = concentration
+
+        # only the climate regions with cities count, as in calc_weighted_average_per_scenario
+        climate_regions, self.region_index = np.unique(np.asarray(climate_region_array), return_inverse=True)
+        self.region_weights = get_region_weights(floor_area_climate_df, sectors).loc[climate_regions].values.T
+        self.membership = (self.region_index[np.newaxis, :] == np.arange(len(climate_regions))[:, np.newaxis])
+        self.n_cities_per_region = self.membership.sum(axis=1)
+
+    @property
+    def shape(self):
+        return self.gfa_mean_m2.shape
+
+    def draw(self, rng, n_samples):
+        """
+        :return: dictionary variable -> array of shape (n_scenarios, n_sectors, n_samples), see VALUE_COLUMNS
+        """
+        n_sectors, n_regions = self.region_weights.shape
+
+        # gross floor area, shape (n_scenarios, n_sectors, n_samples)
+        if "floor_area" in self.sources:
+            z = np.moveaxis(rng.standard_normal((n_samples,) + self.shape), 0, -1)
+            GFA_m2 = self.gfa_mean_m2[..., np.newaxis] + self.gfa_std_m2[..., np.newaxis] * z
+        else:
+            GFA_m2 = np.repeat(self.gfa_mean_m2[..., np.newaxis], n_samples, axis=-1)
+
+        # weights of the climate regions, shape (n_samples, n_sectors, n_regions), with the same total as the shares
+        total_weight = self.region_weights.sum(axis=1, keepdims=True)
+        if "weights" in self.sources:
+            gamma = rng.standard_gamma(self.concentration * self.region_weights / total_weight,
+                                       size=(n_samples, n_sectors, n_regions))
+            region_weights = total_weight * gamma / gamma.sum(axis=-1, keepdims=True)
+        else:
+            region_weights = np.broadcast_to(self.region_weights, (n_samples, n_sectors, n_regions))
+
+        # share of every city in the mean of its climate region, shape (n_samples, n_cities)
+        if "cities" in self.sources:
+            gamma = rng.standard_exponential((n_samples, len(self.region_index)))
+            city_share = gamma / (gamma @ self.membership.T)[:, self.region_index]
+        else:
+            city_share = np.broadcast_to(1.0 / self.n_cities_per_region[self.region_index],
+                                         (n_samples, len(self.region_index)))
+
+        # weighted average of the cities as one matrix product per sector, shape (n_scenarios, n_sectors, 2, n_samples)
+        city_weights = region_weights[:, :, self.region_index] * city_share[:, np.newaxis, :]
+        n_scenarios, _, n_cities, n_uses = self.city_intensity.shape
+        intensity_kWhm2yr = np.empty((n_scenarios, n_sectors, n_uses, n_samples))
+        for k in range(n_sectors):
+            city_intensity = np.moveaxis(self.city_intensity[:, k], 1, -1).reshape(n_scenarios * n_uses, n_cities)
+            intensity_kWhm2yr[:, k] = (city_intensity @ city_weights[:, k].T).reshape(n_scenarios, n_uses,
+                                                                                     n_samples)
+
+        return {"GFA_Bm2": GFA_m2 / 1E9,
+                "TOTAL_HEATING_EJ": GFA_m2 * intensity_kWhm2yr[:, :, 0] * 3.6E-12,
+                "TOTAL_COOLING_EJ": GFA_m2 * intensity_kWhm2yr[:, :, 1] * 3.6E-12}
+
+    def calc_block_accumulators(self, seed_sequence, n_samples, method='exact'):
+        # percentiles of a block of n_samples joint samples with its own random generator
+        samples = self.draw(np.random.default_rng(seed_sequence), n_samples)
+        accumulators = {use: PercentileAccumulator(self.shape, method) for use in VALUE_COLUMNS}
+        for use, accumulator in accumulators.items():
+            accumulator.update(samples[use])
+        return accumulators
+
+
+def init_worker(model):
+    global worker_model
+    worker_model = model
+    # the peak memory is only measured in the main process, a forked worker does not trace its allocations
+    tracemalloc.stop()
+
+
+def calc_worker_block_accumulators(seed_sequence, n_samples, method):
+    return worker_model.calc_block_accumulators(seed_sequence, n_samples, method)
+
+
+def get_city_intensity_array(specific_thermal_consumption_per_city_df, scenarios_array, sectors, cities_array):
+    # heating and cooling per scenario, sector and city, array of shape (n_scenarios, n_sectors, n_cities, 2)
+    index = pd.MultiIndex.from_product([scenarios_array, sectors, cities_array])
+    city_intensity = specific_thermal_consumption_per_city_df.set_index(["SCENARIO", "BUILDING_CLASS", "CITY"])[
+        ["TOTAL_HEATING_kWh_m2_yr", "TOTAL_COOLING_kWh_m2_yr"]].reindex(index).values
+    if np.isnan(city_intensity).any():
+        raise ValueError("every city needs a value for every scenario and building class")
+    return city_intensity.reshape(len(scenarios_array), len(sectors), len(cities_array), 2)
+
+
+def calc_joint_percentiles_per_scenario(specific_thermal_consumption_per_city_df, cities_array, climate_region_array,
+                                        floor_area_predictions_df, floor_area_climate_df, scenarios_array, sectors,
+                                        n_samples=MONTECARLO_N_SAMPLES, seed=MONTECARLO_SEED, method='tdigest',
+                                        sources=UNCERTAINTY_SOURCES, concentration=MONTECARLO_WEIGHT_CONCENTRATION,
+                                        workers=1, chunk_size=MONTECARLO_JOINT_CHUNK_SIZE):
+    """
+    Percentiles of the energy consumption per scenario and sector with the joint montecarlo simulation of
+    JointUncertaintyModel, same table as calc_percentiles_per_scenario.
+
+    The samples are split in blocks of chunk_size samples, each with its own random generator spawned from the seed,
+    so the result does not depend on the number of workers. With method='tdigest' the memory does not grow with
+    n_samples.
+    """
+    city_intensity = get_city_intensity_array(specific_thermal_consumption_per_city_df, scenarios_array, sectors,
+                                              cities_array)
+    years = [scenario.split("_")[-1] for scenario in scenarios_array]
+    gfa_mean_m2, gfa_std_m2 = get_floor_area_distribution(floor_area_predictions_df, years, sectors)
+    model = JointUncertaintyModel(city_intensity, climate_region_array, floor_area_climate_df, gfa_mean_m2,
+                                  gfa_std_m2, sectors, sources, concentration)
+
+    # one block of samples per seed
+    block_sizes = [min(chunk_size, n_samples - start) for start in range(0, n_samples, chunk_size)]
+    blocks = zip(np.random.SeedSequence(seed).spawn(len(block_sizes)), block_sizes)
+    if workers > 1 and len(block_sizes) > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(model,))
+        computed = (block_accumulators for _, block_accumulators in iter_submitted(
+            executor, calc_worker_block_accumulators, ((seed_sequence, block_size, method)
+                                                       for seed_sequence, block_size in blocks),
+            max_pending=2 * workers))
+    else:
+        executor = None
+        computed = (model.calc_block_accumulators(seed_sequence, block_size, method)
+                    for seed_sequence, block_size in blocks)
+
+    # merge the percentiles of every block
+    accumulators = {use: PercentileAccumulator(model.shape, method) for use in VALUE_COLUMNS}
+    try:
+        for block_accumulators in computed:
+            for use, accumulator in accumulators.items():
+                accumulator.merge(block_accumulators[use])
+    finally:
+        # on an error, the calls not started yet are cancelled instead of run by the shutdown
+        computed.close()
+        if executor is not None:
+            executor.shutdown()
+    return build_percentiles_df({use: accumulator.percentile() for use, accumulator in accumulators.items()},
+                                scenarios_array, sectors)
@@ -0,0 +1,70 @@
+'''MIT License
+
+Copyright (c) 2020 Jimeno A. Fonseca
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+'''
+
+import numpy as np
+import pandas as pd
+
+
+def calc_region_averaging_matrix(climate_region_array, climate_regions):
+    """
+    Matrix of shape (n_regions, n_cities) averaging the values of the cities of every climate region, i.e.,
+    1 / (number of cities of the region) for the cities of the region and 0 elsewhere. A region without cities has
+    a row of zeros.
+    """
+    climate_region_array = np.asarray(climate_region_array)
+    membership = (np.asarray(climate_regions)[:, np.newaxis] == climate_region_array[np.newaxis, :]).astype(np.float64)
+    n_cities = membership.sum(axis=1, keepdims=True)
+    return membership / np.where(n_cities > 0, n_cities, 1.0)
+
+
+def get_region_weights(floor_area_climate_df, sectors):
+    """
+    Weight of every climate region per sector, share of the built area in FLOOR_AREA_CLIMATE. Dataframe indexed by
+    climate region with one column per sector.
+    """
+    return pd.DataFrame({sector: floor_area_climate_df['GFA_mean_' + sector + '_perc'] for sector in sectors})
+
+
+def calc_city_weight_matrix(climate_region_array, region_weights):
+    """
+    Weight of every city in the national average, matrix of shape (n_sectors, n_cities): the weight of its climate
+    region divided by the number of cities of the region. It is the product of the region weights and
+    calc_region_averaging_matrix, so regions without cities do not count.
+
+    :param climate_region_array: climate region of every city
+    :param region_weights: dataframe indexed by climate region with one column per sector, see get_region_weights
+    """
+    climate_regions = np.unique(np.asarray(climate_region_array))
+    averaging_matrix = calc_region_averaging_matrix(climate_region_array, climate_regions)
+    return region_weights.loc[climate_regions].values.T @ averaging_matrix
+
+
+def calc_national_intensity(city_values, city_weight_matrix):
+    """
+    Weighted average of city_values, as one matrix product per sector.
+
+    :param city_values: array of shape (..., n_sectors, n_cities), e.g., (n_scenarios, n_sectors, n_cities)
+    :param city_weight_matrix: array of shape (n_sectors, n_cities), see calc_city_weight_matrix
+    :return: array of shape (..., n_sectors)
+    """
+    return np.matmul(city_values[..., np.newaxis, :], city_weight_matrix[..., np.newaxis])[..., 0, 0]
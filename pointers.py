@@ -26,5 +26,11 @@ import os
 
 METADATA_FILE_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "data", "metadata.xlsx")
 INTERMEDIATE_RESULT_FILE_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "results", "intermediate_result.csv")
+INTERMEDIATE_PERCENTILES_FILE_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "results", "intermediate_percentiles.csv")
 FINAL_RESULT_FILE_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "results", "final_result.csv")
-WEATHER_DATA_FOLDER_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "data", "weather_data")
+# the weather folders can be moved with the environment variables DEG_USA_WEATHER_DATA and DEG_USA_WEATHER_CACHE
+WEATHER_DATA_FOLDER_PATH = os.environ.get("DEG_USA_WEATHER_DATA", os.path.join(os.path.abspath(os.path.dirname(__file__)), "data", "weather_data"))
+WEATHER_CACHE_FOLDER_PATH = os.environ.get("DEG_USA_WEATHER_CACHE", os.path.join(os.path.abspath(os.path.dirname(__file__)), "data", "weather_cache"))
+RESULT_CACHE_FILE_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "data", "result_cache.sqlite")
+NATIONAL_PROFILES_FILE_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "results", "national_profiles.npy")
+JOURNAL_FILE_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "results", "intermediate_result.journal")
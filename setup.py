@@ -50,8 +50,9 @@ setup(
     description="DEG-USA: forecasting model based on Enthalpy Gradients for Climate Change Impact Scenarios in the USA",
     long_description=long_description,
     long_description_content_type='text/markdown',
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=install_requires,
+    extras_require={'parquet': ['pyarrow']},
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",